@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def job_id(job):
+    if "id" in job:
+        return str(job["id"])
+    payload = json.dumps([job["key_words"], job["abstract"]], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def load_jobs(jobs_path):
+    jobs = []
+    with open(jobs_path, "r") as file:
+        for line in file:
+            if line.strip():
+                job = json.loads(line)
+                job["id"] = job_id(job)
+                jobs.append(job)
+    return jobs
+
+
+def load_done(output_path):
+    """Ids of jobs that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # last line of a run that crashed mid-write
+                continue
+            if "error" not in result:
+                done.add(result["id"])
+    return done
+
+
+def group_jobs(jobs):
+    """
+    Orders jobs so that jobs sharing any keyword run next to each other and
+    reuse the same cached searches and index entries.
+    """
+    parent = list(range(len(jobs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner = {}
+    for i, job in enumerate(jobs):
+        for kw in job["key_words"]:
+            kw = " ".join(kw.lower().split())
+            if kw in owner:
+                parent[find(i)] = find(owner[kw])
+            else:
+                owner[kw] = i
+
+    groups = {}
+    for i, job in enumerate(jobs):
+        groups.setdefault(find(i), []).append(job)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def run_batch(reviewer, jobs_path, output_path, workers=4):
+    jobs = load_jobs(jobs_path)
+    done = load_done(output_path)
+    pending = [job for job in jobs if job["id"] not in done]
+    groups = group_jobs(pending)
+    print(f"{len(jobs)} jobs, {len(done)} already done, {len(pending)} pending in {len(groups)} keyword groups")
+
+    stage_totals, n_ok, n_failed = {}, 0, 0
+    start = time.perf_counter()
+
+    def run_job(job):
+        try:
+            result = reviewer.review(job["key_words"], job["abstract"])
+            return {"id": job["id"], **result}
+        except Exception as e:
+            return {"id": job["id"], "error": str(e)}
+
+    with open(output_path, "a") as output, ThreadPoolExecutor(max_workers=workers) as executor:
+        if output.tell() > 0:
+            # start on a fresh line in case the previous run died mid-write
+            output.write("\n")
+        # groups are submitted in order, so overlapping jobs run close together
+        futures = [executor.submit(run_job, job) for group in groups for job in group]
+        for future in as_completed(futures):
+            result = future.result()
+            # results are written as they finish so a crashed run can resume
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            if "error" in result:
+                n_failed += 1
+                print(f"✗ job {result['id']}: {result['error']}")
+                continue
+            n_ok += 1
+            for stage, seconds in result["timings"].items():
+                if seconds is not None:
+                    stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+    elapsed = time.perf_counter() - start
+    print(f"{n_ok} reviews, {n_failed} failed in {elapsed:.1f}s ({n_ok / elapsed if elapsed else 0:.3f} reviews/s)")
+    for stage, seconds in stage_totals.items():
+        print(f"  {stage}: {seconds:.1f}s total, {seconds / max(n_ok, 1):.2f}s per review")
+    cache = reviewer.llm_cache.stats()
+    print(f"  llm cache: {cache['hit_ratio']:.1%} hit ratio, {cache['saved_seconds']:.1f}s generation saved")
+    return stage_totals
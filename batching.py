@@ -0,0 +1,152 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent callers and runs them through `fn`
+    in a single call, once `max_batch_size` items are queued or `max_wait`
+    seconds have passed since the first pending request.
+
+    `fn` takes a list of items and returns a list of results of the same length.
+    """
+
+    def __init__(self, fn, max_batch_size=100, max_wait=0.005, name="micro-batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, items):
+        items = list(items)
+        if not items:
+            return []
+        if self._closed:
+            raise RuntimeError("batcher is closed")
+        future = Future()
+        self._queue.put((items, future))
+        return future.result()
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self):
+        request = self._queue.get()
+        if request is None:
+            return None
+        batch, n_items = [request], len(request[0])
+        deadline = time.monotonic() + self.max_wait
+        while n_items < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # finish the current batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+            n_items += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            flat_items = [item for items, _ in batch for item in items]
+            try:
+                results = self.fn(flat_items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for items, future in batch:
+                future.set_result(results[start:start + len(items)])
+                start += len(items)
+
+
+class BatchedReranker:
+    """Drop-in for `FlagReranker.compute_score` that shares forward passes across requests."""
+
+    def __init__(self, model, max_batch_size=100, max_wait=0.005):
+        self.model = model
+        self._batcher = MicroBatcher(self._score, max_batch_size, max_wait, name="reranker-batcher")
+
+    def _score(self, sentence_pairs):
+        scores = self.model.compute_score(sentence_pairs, batch_size=self._batcher.max_batch_size)
+        if not isinstance(scores, list):
+            scores = [scores]
+        return scores
+
+    def compute_score(self, sentence_pairs, batch_size=None):
+        return self._batcher.submit(sentence_pairs)
+
+    def close(self):
+        self._batcher.close()
+
+
+class BatchedEncoder:
+    """
+    Drop-in for `BGEM3FlagModel.encode` that shares forward passes across requests.
+
+    Calls with different encode options (max_length, returned modes) are
+    batched separately.
+    """
+
+    def __init__(self, model, max_batch_size=100, max_wait=0.005):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def _get_batcher(self, options):
+        with self._lock:
+            if options not in self._batchers:
+                self._batchers[options] = MicroBatcher(
+                    lambda texts: self._encode(texts, dict(options)),
+                    self.max_batch_size,
+                    self.max_wait,
+                    name="encoder-batcher"
+                )
+            return self._batchers[options]
+
+    def _encode(self, texts, options):
+        output = self.model.encode(texts, batch_size=self.max_batch_size, **options)
+        return [
+            {
+                "dense_vecs": output["dense_vecs"][i] if options.get("return_dense", True) else None,
+                "lexical_weights": output["lexical_weights"][i] if options.get("return_sparse") else None,
+                "colbert_vecs": output["colbert_vecs"][i] if options.get("return_colbert_vecs") else None,
+            }
+            for i in range(len(texts))
+        ]
+
+    def encode(self, sentences, batch_size=None, **options):
+        items = self._get_batcher(tuple(sorted(options.items()))).submit(sentences)
+        return_dense = options.get("return_dense", True) and len(items) > 0
+        return {
+            "dense_vecs": np.stack([item["dense_vecs"] for item in items]) if return_dense else None,
+            "lexical_weights": [item["lexical_weights"] for item in items] if options.get("return_sparse") else None,
+            "colbert_vecs": [item["colbert_vecs"] for item in items] if options.get("return_colbert_vecs") else None,
+        }
+
+    def close(self):
+        with self._lock:
+            for batcher in self._batchers.values():
+                batcher.close()
+            self._batchers = {}
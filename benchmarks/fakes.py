@@ -0,0 +1,85 @@
+"""
+Deterministic CPU stand-ins for BGE-M3, the cross-encoder reranker and the
+generation tokenizer. They return the same output layout as the real models,
+so every downstream stage (index, recall, rerank, context packing, prompt
+building) runs its real code on realistic array sizes.
+"""
+import re
+import time
+import zlib
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+\s*|[^\w\s]\s*|\s+")
+
+
+def token_ids(text, vocab_size):
+    return [zlib.crc32((token.strip() or token).encode("utf-8")) % vocab_size for token in TOKEN_PATTERN.findall(text)]
+
+
+class FakeEncoder:
+    """
+    Drop-in for `BGEM3FlagModel.encode`. Token vectors are rows of a fixed
+    random table, the dense vector is their normalized mean and lexical
+    weights are per-token hashes. `seconds_per_token` simulates model cost.
+    """
+
+    def __init__(self, dim=1024, vocab_size=250002, table_rows=4096, seconds_per_token=0.0):
+        self.dim = dim
+        self.vocab_size = vocab_size
+        self.seconds_per_token = seconds_per_token
+        table = np.random.default_rng(0).standard_normal((table_rows, dim)).astype(np.float32)
+        self._table = table / np.linalg.norm(table, axis=1, keepdims=True)
+
+    def encode(self, sentences, batch_size=256, max_length=8192, return_dense=True,
+               return_sparse=False, return_colbert_vecs=False, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        dense_vecs, lexical_weights, colbert_vecs, n_tokens = [], [], [], 0
+        for sentence in sentences:
+            ids = np.asarray(token_ids(sentence.lower(), self.vocab_size)[:max_length] or [0])
+            n_tokens += len(ids)
+            vecs = self._table[ids % len(self._table)]
+            dense = vecs.mean(axis=0)
+            dense_vecs.append(dense / max(np.linalg.norm(dense), 1e-12))
+            if return_sparse:
+                weights = {}
+                for token in ids.tolist():
+                    weights[str(token)] = max(weights.get(str(token), 0.0), (token % 1000) / 3000 + 0.05)
+                lexical_weights.append(weights)
+            if return_colbert_vecs:
+                colbert_vecs.append(vecs)
+        if self.seconds_per_token:
+            time.sleep(self.seconds_per_token * n_tokens)
+        return {
+            "dense_vecs": np.stack(dense_vecs),
+            "lexical_weights": lexical_weights if return_sparse else None,
+            "colbert_vecs": colbert_vecs if return_colbert_vecs else None,
+        }
+
+
+class FakeReranker:
+    """Drop-in for `FlagReranker.compute_score`: word-overlap score of each (query, passage) pair."""
+
+    def __init__(self, seconds_per_pair=0.0):
+        self.seconds_per_pair = seconds_per_pair
+
+    def compute_score(self, sentence_pairs, batch_size=256, **kwargs):
+        scores = []
+        for query, passage in sentence_pairs:
+            query_words = set(query.lower().split())
+            passage_words = set(passage.lower().split())
+            scores.append(len(query_words & passage_words) / (len(query_words | passage_words) or 1))
+        if self.seconds_per_pair:
+            time.sleep(self.seconds_per_pair * len(sentence_pairs))
+        return scores
+
+
+class FakeTokenizer:
+    """Word/punctuation tokenizer with the `encode` signature the pipeline uses."""
+
+    def __init__(self, vocab_size=128256):
+        self.vocab_size = vocab_size
+
+    def encode(self, text, add_special_tokens=True):
+        return token_ids(text, self.vocab_size)
@@ -0,0 +1,88 @@
+"""
+Scalable fixture corpora built from `papers.json` and the PDFs in `downloads/`.
+"""
+import hashlib
+import json
+import random
+from pathlib import Path
+
+
+def load_papers(path):
+    papers = []
+    with open(path, "r") as file:
+        for line in file:
+            if line.strip():
+                papers.append(json.loads(line))
+    return papers
+
+
+def load_pdfs(pdf_dir):
+    pdfs = [path.read_bytes() for path in sorted(Path(pdf_dir).glob("*.pdf"))]
+    if not pdfs:
+        raise FileNotFoundError(f"no fixture PDFs in {pdf_dir}")
+    return pdfs
+
+
+def scale_corpus(papers, n_papers, pdf_base_url, open_access_ratio=0.3, seed=0, duplicate_ratio=0.0):
+    """
+    Raw Semantic Scholar search records for `n_papers` papers. Beyond the
+    size of `papers.json` the records are replicas with fresh ids whose
+    abstracts mix sentences of several papers, so they are distinct works
+    that are encoded separately. A `duplicate_ratio` share of the records
+    are instead copies of an earlier record, as a preprint and its
+    published version would be. Open-access papers point at
+    `<pdf_base_url>/<paperId>.pdf`.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n_papers):
+        if corpus and rng.random() < duplicate_ratio:
+            original = rng.choice(corpus)
+            paper_id = hashlib.sha1(f'{original["paperId"]}-copy-{i}'.encode("utf-8")).hexdigest()
+            is_open = rng.random() < open_access_ratio
+            corpus.append(dict(
+                original,
+                paperId=paper_id,
+                title=original["title"].upper() if rng.random() < 0.5 else f'{original["title"]}.',
+                citationCount=rng.randint(0, original["citationCount"] or 0),
+                isOpenAccess=is_open,
+                openAccessPdf={"url": f"{pdf_base_url}/{paper_id}.pdf"} if is_open else None,
+            ))
+            continue
+        paper = papers[i % len(papers)]
+        replica = i // len(papers)
+        paper_id = paper["paperId"]
+        title, abstract = paper["title"], paper["abstract"]
+        if replica:
+            paper_id = hashlib.sha1(f"{paper_id}-{replica}".encode("utf-8")).hexdigest()
+            title = f"{title} ({replica})"
+            if abstract:
+                sentences = abstract.split(". ")
+                donors = [rng.choice(papers)["abstract"] or "" for _ in range(2)]
+                pool = sentences + [sentence for donor in donors for sentence in donor.split(". ") if sentence]
+                abstract = ". ".join(rng.sample(pool, len(sentences)))
+        is_open = rng.random() < open_access_ratio
+        corpus.append({
+            "paperId": paper_id,
+            "year": paper["year"],
+            "title": title,
+            "authors": [{"name": name} for name in (paper["authors"] or "").split(", ") if name],
+            "venue": paper["venue"],
+            "citationCount": paper["citationCount"],
+            "abstract": abstract,
+            "isOpenAccess": is_open,
+            "openAccessPdf": {"url": f"{pdf_base_url}/{paper_id}.pdf"} if is_open else None,
+        })
+    return corpus
+
+
+def make_jobs(papers, n_jobs, seed=0):
+    """Review jobs whose abstracts and keywords come from papers in the fixture."""
+    rng = random.Random(seed)
+    candidates = [paper for paper in papers if paper["abstract"]]
+    jobs = []
+    for i in range(n_jobs):
+        paper = rng.choice(candidates)
+        words = [word.strip(",:;.()").lower() for word in paper["title"].split() if len(word) > 4]
+        jobs.append({"key_words": words[:3] or ["generative ai"], "abstract": paper["abstract"]})
+    return jobs
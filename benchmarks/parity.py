@@ -0,0 +1,82 @@
+"""
+Parity of `CorpusIndex.score` with `BGEM3FlagModel.compute_score`.
+
+Indexes a few fixture papers with the real BGE-M3 encoder and compares the
+index's dense, sparse, colbert and combined scores for a few queries with
+the scores `compute_score` gives the same (query, passage) pairs. Exits
+non-zero when any score differs by more than `--tolerance`; fp16 encoding
+leaves differences around 1e-3.
+
+    python benchmarks/parity.py --papers 8 --queries 3
+"""
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fixtures
+from corpus_index import CorpusIndex, format_paper
+
+MODES = {
+    "dense": (1, 0, 0),
+    "sparse": (0, 1, 0),
+    "colbert": (0, 0, 1),
+    "colbert+sparse+dense": (0.4, 0.2, 0.4),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=3)
+    parser.add_argument("--max_passage_length", type=int, default=2048)
+    parser.add_argument("--tolerance", type=float, default=1e-2)
+    parser.add_argument("--fp32", action="store_true", help="Encode without fp16")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from FlagEmbedding import BGEM3FlagModel
+    model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=not args.fp32)
+
+    papers = fixtures.load_papers(ROOT / "papers.json")
+    corpus = [
+        {"paperId": paper["paperId"], "title": paper["title"], "abstract": paper["abstract"]}
+        for paper in papers[:args.papers]
+    ]
+    queries = [job["abstract"] for job in fixtures.make_jobs(papers, args.queries, args.seed)]
+    paper_ids = [paper["paperId"] for paper in corpus]
+
+    # two shards, so scoring across shard boundaries is covered
+    index = CorpusIndex(model, index_dir=tempfile.mkdtemp(prefix="aspr-parity-"),
+                        max_passage_length=args.max_passage_length)
+    index.add(corpus[:len(corpus) // 2])
+    index.add(corpus)
+
+    report, failed = {}, False
+    for i, query in enumerate(queries):
+        expected = model.compute_score(
+            [[query, format_paper(paper)] for paper in corpus],
+            max_passage_length=args.max_passage_length,
+            weights_for_different_modes=list(MODES["colbert+sparse+dense"])
+        )
+        encoded_query = index.encode_query(query)
+        for mode, weights in MODES.items():
+            error = float(np.max(np.abs(
+                index.score(query, paper_ids, weights, encoded_query) - np.asarray(expected[mode])
+            )))
+            report.setdefault(mode, []).append(error)
+            failed |= error > args.tolerance
+
+    print(json.dumps({mode: {"max_abs_error": max(errors)} for mode, errors in report.items()}, indent=2))
+    if failed:
+        sys.exit(f"scores differ by more than {args.tolerance}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Recall and memory of the quantized corpus index against the float one.
+
+Builds a float index over a scaled fixture corpus with the fake encoder,
+then opens the same shards with each quantization (the codes are derived
+from the stored floats) and runs `retrieval_recall` for a set of queries.
+recall@k is the share of the float path's top-k that the quantized path
+also returns; `codes_only` is the same before float rescoring.
+
+All shard arrays, codes included, are memory-mapped. `resident_mb` is what
+a mode's queries actually paged in (the Rss of its mappings in
+/proc/self/smaps, Linux only), `mapped_mb` the size of everything mapped and
+`codes_mb` the part of it that is quantized codes. int8 codes are about 4x
+smaller than the float vectors, binary codes about 30x, but the rescored
+candidates still page in their float vectors, and a pass that keeps nearly
+as many papers as it ranks (the colbert pass with the default --recall_k /
+--rerank_m) skips the codes altogether; the saving grows with the number of
+papers a dense pass ranks.
+
+    python benchmarks/quantization.py --papers 2000 --queries 50 --output quantization.json
+"""
+import bisect
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fakes
+import fixtures
+from corpus_index import QUANTIZED_ARRAYS, CorpusIndex
+from open_scholar import retrieval_recall
+
+
+def resident_bytes(index):
+    """Resident bytes of the index's memory-mapped arrays in this process; None without /proc/self/smaps."""
+    try:
+        with open("/proc/self/smaps", "r") as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return None
+    starts, ends, rss = [], [], []
+    for line in lines:
+        field = line.split(maxsplit=1)[0] if line else ""
+        if "-" in field and not field.endswith(":"):
+            start, end = field.split("-")
+            starts.append(int(start, 16))
+            ends.append(int(end, 16))
+            rss.append(0)
+        elif field == "Rss:":
+            rss[-1] = int(line.split()[1]) * 1024
+    regions = set()
+    for shard in index._shards:
+        for array in shard.values():
+            address = array.ctypes.data
+            region = bisect.bisect_right(starts, address) - 1
+            if array.nbytes and region >= 0 and address < ends[region]:
+                regions.add(region)
+    return sum(rss[region] for region in regions)
+
+
+def memory_report(index):
+    resident = resident_bytes(index)
+    return {
+        "resident_mb": None if resident is None else resident / 2 ** 20,
+        "mapped_mb": index.mapped_bytes() / 2 ** 20,
+        "codes_mb": index.mapped_bytes(QUANTIZED_ARRAYS.get(index.quantization, ())) / 2 ** 20,
+    }
+
+
+def recall_at_k(reference, candidate):
+    return len(set(reference) & set(candidate)) / len(reference) if reference else 1.0
+
+
+def evaluate(index, queries, paper_ids, recall_k, rerank_m):
+    results, seconds = [], []
+    for query in queries:
+        start = time.perf_counter()
+        final_ids, _ = retrieval_recall(query, paper_ids, index, recall_k=recall_k, rerank_m=rerank_m)
+        seconds.append(time.perf_counter() - start)
+        encoded_query = index.encode_query(query)
+        dense_ids, _ = index.search(query, paper_ids, [1, 0, 0], encoded_query, top_k=recall_k)
+        scores = index.score(query, paper_ids, [1, 0, 0], encoded_query)
+        codes_only = [paper_ids[i] for i in np.argsort(-scores, kind="stable")[:recall_k]]
+        results.append({"dense": dense_ids, "final": final_ids, "codes_only": codes_only})
+    return results, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--recall_k", type=int, default=100)
+    parser.add_argument("--rerank_m", type=int, default=30)
+    parser.add_argument("--oversample", type=int, default=None, help="Defaults to the index's per-mode value")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--index_dir", type=str, default=None, help="Defaults to a fresh temporary directory")
+    parser.add_argument("--output", type=str, default=None, help="Report file; printed when omitted")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="aspr-quantization-")
+    papers = fixtures.load_papers(ROOT / "papers.json")
+    corpus = [
+        {"paperId": paper["paperId"], "title": paper["title"], "abstract": paper["abstract"]}
+        for paper in fixtures.scale_corpus(papers, args.papers, "http://localhost", 0.0, args.seed)
+    ]
+    queries = [job["abstract"] for job in fixtures.make_jobs(papers, args.queries, args.seed)]
+    encoder = fakes.FakeEncoder(dim=args.dim)
+
+    start = time.perf_counter()
+    index = CorpusIndex(encoder, index_dir=index_dir)
+    for i in range(0, len(corpus), 1000):
+        index.add(corpus[i:i + 1000])
+    build_seconds = time.perf_counter() - start
+    paper_ids = [paper["paperId"] for paper in corpus]
+
+    reference, seconds = evaluate(index, queries, paper_ids, args.recall_k, args.rerank_m)
+    report = {
+        "config": dict(vars(args), index_dir=index_dir),
+        "build_seconds": build_seconds,
+        "modes": {
+            "float": {
+                **memory_report(index),
+                "query_p50_seconds": float(np.median(seconds)),
+            },
+        },
+    }
+    for quantization in ("int8", "binary"):
+        start = time.perf_counter()
+        quantized = CorpusIndex(encoder, index_dir=index_dir, quantization=quantization, oversample=args.oversample)
+        open_seconds = time.perf_counter() - start
+        results, seconds = evaluate(quantized, queries, paper_ids, args.recall_k, args.rerank_m)
+        report["modes"][quantization] = {
+            **memory_report(quantized),
+            "open_seconds": open_seconds,
+            "query_p50_seconds": float(np.median(seconds)),
+            **{
+                f"{stage}_recall@{k}": float(np.mean([
+                    recall_at_k(expected[stage if stage != "codes_only" else "dense"], result[stage])
+                    for expected, result in zip(reference, results)
+                ]))
+                for stage, k in (("codes_only", args.recall_k), ("dense", args.recall_k), ("final", args.rerank_m))
+            },
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Offline end-to-end benchmark of the review pipeline.
+
+Every external service is replaced by a local stub (see stubs.py) and, by
+default, the models by deterministic fakes (see fakes.py), so the run needs
+no network and no GPU. Reviews run in passes over the same jobs: the first
+pass starts with empty caches, later passes hit them. The JSON report holds
+per-stage latency percentiles, throughput and peak RSS.
+
+    python benchmarks/run.py --papers 5000 --reviews 16 --concurrency 4 --output bench.json
+
+Arguments this script does not know are passed to open_scholar's parser,
+e.g. `--recall_k 200 --send_token_ids`. With `--models real` the reviewer
+loads its models as usual, so point `--reranker_path` / `--large_model` at
+small checkpoints on a CPU box. `--graph_rag` also times a GraphRAG insert
+and query against the Ollama stub; its chunker needs tiktoken's o200k_base
+encoding to be cached locally.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fakes
+import fixtures
+import stubs
+from open_scholar import Reviewer, build_parser
+
+
+class BenchReviewer(Reviewer):
+    """Reviewer whose models can be injected instead of loaded."""
+
+    def __init__(self, args, encoder=None, reranker=None, tokenizer=None):
+        self._encoder = encoder
+        self._reranker = reranker
+        self._tokenizer = tokenizer
+        super().__init__(args)
+
+    def load_encoder(self):
+        return self._encoder if self._encoder is not None else super().load_encoder()
+
+    def load_reranker(self):
+        return self._reranker if self._reranker is not None else super().load_reranker()
+
+    def load_tokenizer(self):
+        return self._tokenizer if self._tokenizer is not None else super().load_tokenizer()
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "total": sum(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "max": values[-1],
+    }
+
+
+def run_pass(reviewer, jobs, concurrency):
+    def run_job(job):
+        try:
+            return reviewer.review(job["key_words"], job["abstract"])
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    start = time.perf_counter()
+    # the pipeline prints progress for every paper; keep it out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(run_job, jobs))
+    wall = time.perf_counter() - start
+
+    ok = [result for result in results if "error" not in result]
+    stages = {}
+    for result in ok:
+        for stage, seconds in result["timings"].items():
+            if seconds is not None:
+                stages.setdefault(stage, []).append(seconds)
+    return {
+        "wall_seconds": wall,
+        "reviews": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": sorted({result["error"] for result in results if "error" in result}),
+        "reviews_per_second": len(ok) / wall if wall else 0.0,
+        "stages": {stage: summarize(values) for stage, values in stages.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_graph_rag(ollama_url, workdir, papers, n_docs):
+    os.environ["OLLAMA_HOST"] = ollama_url
+    import graph_rag
+    graph_rag.WORKING_DIR = str(workdir / "graph")
+    session = graph_rag.GraphRAGSession(working_dir=graph_rag.WORKING_DIR, flush_interval=3600)
+    docs = [f'Title:{paper["title"]}. Abstract:{paper["abstract"]}' for paper in papers[:n_docs]]
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        session.insert(docs)
+        timings["insert"] = time.perf_counter() - start
+        start = time.perf_counter()
+        session.insert(docs[0] + " Addendum.")
+        timings["incremental_insert"] = time.perf_counter() - start
+        for mode in ("local", "global"):
+            start = time.perf_counter()
+            session.query("What are the main contributions?", mode=mode)
+            timings[f"query_{mode}"] = time.perf_counter() - start
+        start = time.perf_counter()
+        session.close()
+        timings["flush"] = time.perf_counter() - start
+    timings["llm_cache"] = graph_rag.llm_cache.stats()
+    return timings
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=1000, help="Papers returned by every search")
+    parser.add_argument("--reviews", type=int, default=8, help="Review jobs per pass")
+    parser.add_argument("--concurrency", type=int, default=4, help="Reviews in flight")
+    parser.add_argument("--passes", type=int, default=2, help="First pass is cold, later ones warm")
+    parser.add_argument("--models", choices=["fake", "real"], default="fake")
+    parser.add_argument("--dim", type=int, default=1024, help="Fake encoder vector size")
+    parser.add_argument("--encoder_us_per_token", type=float, default=0.0, help="Simulated fake encoder cost")
+    parser.add_argument("--rerank_us_per_pair", type=float, default=0.0, help="Simulated fake reranker cost")
+    parser.add_argument("--open_access", type=float, default=0.3, help="Share of papers with a PDF")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="Share of search results copying an earlier one")
+    parser.add_argument("--page_size", type=int, default=1000, help="Search results per page")
+    parser.add_argument("--s2_latency_ms", type=float, default=0.0)
+    parser.add_argument("--pdf_latency_ms", type=float, default=0.0)
+    parser.add_argument("--gen_tokens", type=int, default=200, help="Tokens streamed per generation")
+    parser.add_argument("--ttft_ms", type=float, default=50.0)
+    parser.add_argument("--token_ms", type=float, default=2.0)
+    parser.add_argument("--graph_rag", action="store_true", help="Also time GraphRAG insert and query")
+    parser.add_argument("--graph_docs", type=int, default=20)
+    parser.add_argument("--workdir", type=str, default=None, help="Defaults to a fresh temporary directory")
+    parser.add_argument("--output", type=str, default=None, help="Report file; printed when omitted")
+    parser.add_argument("--seed", type=int, default=0)
+    args, reviewer_argv = parser.parse_known_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="aspr-bench-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    output = Path(args.output).resolve() if args.output else None
+    papers = fixtures.load_papers(ROOT / "papers.json")
+
+    anthology = stubs.StubServer(
+        stubs.AnthologyHandler, pdfs=fixtures.load_pdfs(ROOT / "downloads"), latency=args.pdf_latency_ms / 1000
+    )
+    corpus = fixtures.scale_corpus(papers, args.papers, anthology.url, args.open_access, args.seed, args.duplicates)
+    scholar = stubs.StubServer(
+        stubs.SemanticScholarHandler, corpus=corpus, page_size=args.page_size, latency=args.s2_latency_ms / 1000
+    )
+    llm = stubs.StubServer(
+        stubs.OpenAIHandler, gen_tokens=args.gen_tokens, latency=args.ttft_ms / 1000, token_delay=args.token_ms / 1000
+    )
+
+    reviewer_args = build_parser().parse_args(reviewer_argv)
+    reviewer_args.s2_url = f"{scholar.url}/graph/v1/paper/search/bulk"
+    reviewer_args.max_search_results = args.papers
+    reviewer_args.large_model_port = llm.port
+    reviewer_args.download_host_rate = 1e6
+    reviewer_args.search_cache = str(workdir / "cache" / "search_cache.sqlite")
+    reviewer_args.llm_cache_dir = str(workdir / "cache")
+    reviewer_args.index_dir = str(workdir / "corpus_index")
+    reviewer_args.text_cache_dir = str(workdir / "text_cache")
+
+    models = {}
+    if args.models == "fake":
+        models = {
+            "encoder": fakes.FakeEncoder(dim=args.dim, seconds_per_token=args.encoder_us_per_token / 1e6),
+            "reranker": fakes.FakeReranker(seconds_per_pair=args.rerank_us_per_pair / 1e6),
+            "tokenizer": fakes.FakeTokenizer(),
+        }
+    # the reviewer writes downloads/ and its caches relative to the working directory
+    os.chdir(workdir)
+    start = time.perf_counter()
+    reviewer = BenchReviewer(reviewer_args, **models)
+    startup = time.perf_counter() - start
+
+    jobs = fixtures.make_jobs(papers, args.reviews, args.seed)
+    report = {
+        "commit": git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": dict(vars(args), workdir=str(workdir), reviewer_argv=reviewer_argv),
+        "startup_seconds": startup,
+        "passes": [],
+    }
+    for i in range(args.passes):
+        report["passes"].append(dict(run_pass(reviewer, jobs, args.concurrency), name="cold" if i == 0 else "warm"))
+    report["llm_cache"] = reviewer.llm_cache.stats()
+    if reviewer.tracer.enabled:
+        # per-stage item and token counters, over all passes
+        report["trace"] = reviewer.tracer.snapshot()
+
+    if args.graph_rag:
+        ollama = stubs.StubServer(stubs.OllamaHandler)
+        report["graph_rag"] = run_graph_rag(ollama.url, workdir, papers, args.graph_docs)
+        ollama.close()
+
+    # extraction workers are only counted once they have exited
+    reviewer.text_store.close()
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["peak_rss_children_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    for server in (anthology, scholar, llm):
+        server.close()
+
+    text = json.dumps(report, indent=2)
+    if output is not None:
+        with open(output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
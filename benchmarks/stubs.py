@@ -0,0 +1,217 @@
+"""
+Local stand-ins for the external services the review pipeline talks to:
+Semantic Scholar bulk search, ACL Anthology, an OpenAI-compatible streaming
+server and Ollama. Each stub is a ThreadingHTTPServer on an ephemeral port.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+
+class StubServer:
+    def __init__(self, handler, **state):
+        handler = type(handler.__name__, (handler,), state)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name=handler.__name__, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+
+class SemanticScholarHandler(StubHandler):
+    """Bulk search: pages through `corpus` with an offset continuation token, whatever the query."""
+
+    corpus = []
+    page_size = 1000
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not url.path.endswith("/paper/search/bulk"):
+            self._send_json(404, {"error": "not found"})
+            return
+        time.sleep(self.latency)
+        offset = int(parse_qs(url.query).get("token", ["0"])[0])
+        end = offset + self.page_size
+        self._send_json(200, {
+            "total": len(self.corpus),
+            "token": str(end) if end < len(self.corpus) else None,
+            "data": self.corpus[offset:end],
+        })
+
+
+class AnthologyHandler(StubHandler):
+    """
+    Serves `/<id>/` landing pages pointing at `/<id>.pdf`, and the PDFs
+    themselves from a pool of fixture files with ETag and Range support.
+    """
+
+    pdfs = []
+
+    def _pdf_for(self, paper_id):
+        return self.pdfs[zlib.crc32(paper_id.encode("utf-8")) % len(self.pdfs)]
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        path = urlparse(self.path).path.strip("/")
+        if not path.endswith(".pdf"):
+            pdf_url = f"http://{self.headers['Host']}/{path}.pdf"
+            html = f'<html><head><meta name="citation_pdf_url" content="{pdf_url}"></head></html>'
+            self._send(200, html.encode("utf-8"), content_type="text/html")
+            return
+
+        body = self._pdf_for(path[:-len(".pdf")])
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers={"ETag": etag})
+            return
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if start >= len(body):
+                self._send(416, content_type="text/plain")
+                return
+            self._send(206, body[start:], content_type="application/pdf", headers={
+                "ETag": etag,
+                "Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}",
+            })
+            return
+        self._send(200, body, content_type="application/pdf", headers={"ETag": etag})
+
+
+class OpenAIHandler(StubHandler):
+    """
+    Streams `gen_tokens` tokens (capped by max_tokens) as server-sent events
+    from /v1/chat/completions and /v1/completions. `latency` is the time to
+    first token, `token_delay` the gap between tokens.
+    """
+
+    gen_tokens = 200
+    token_delay = 0.0
+
+    def do_POST(self):
+        request = self._read_json()
+        chat = self.path.endswith("/chat/completions")
+        if not chat and not self.path.endswith("/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+        n_tokens = min(self.gen_tokens, request.get("max_tokens") or self.gen_tokens)
+        tokens = [f" token{i}" for i in range(n_tokens)]
+        time.sleep(self.latency)
+
+        if not request.get("stream"):
+            text = "".join(tokens)
+            choice = {"index": 0, "message": {"role": "assistant", "content": text}} if chat else {"index": 0, "text": text}
+            self._send_json(200, {
+                "id": "bench", "object": "chat.completion" if chat else "text_completion",
+                "created": 0, "model": request.get("model"), "choices": [dict(choice, finish_reason="stop")],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i, token in enumerate(tokens):
+            if i and self.token_delay:
+                time.sleep(self.token_delay)
+            if chat:
+                choice = {"index": 0, "delta": {"content": token}, "finish_reason": None}
+            else:
+                choice = {"index": 0, "text": token, "finish_reason": None, "logprobs": None}
+            chunk = {
+                "id": "bench", "object": "chat.completion.chunk" if chat else "text_completion",
+                "created": 0, "model": request.get("model"), "choices": [choice],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class OllamaHandler(StubHandler):
+    """
+    /api/chat answers nano-graphrag's prompts in the formats it parses:
+    entity records built from capitalized words for extraction, JSON for
+    community reports and global-query maps, plain text otherwise.
+    /api/embed returns hashed unit vectors of `embedding_dim`.
+    """
+
+    embedding_dim = 768
+
+    def do_POST(self):
+        request = self._read_json()
+        time.sleep(self.latency)
+        if self.path == "/api/embed":
+            texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            self._send_json(200, {"model": request["model"], "embeddings": [self._embed(t) for t in texts]})
+        elif self.path == "/api/chat":
+            content = self._answer(request["messages"])
+            self._send_json(200, {
+                "model": request["model"], "created_at": "1970-01-01T00:00:00Z", "done": True,
+                "message": {"role": "assistant", "content": content},
+            })
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _embed(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        vector = rng.standard_normal(self.embedding_dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    @staticmethod
+    def _answer(messages):
+        prompt = messages[-1]["content"]
+        if "YES | NO" in prompt or "were missed" in prompt:
+            return "NO"
+        if "-Real Data-" in prompt:
+            text = prompt.split("-Real Data-", 1)[1]
+            names = list(dict.fromkeys(re.findall(r"\b[A-Z][a-zA-Z]{3,}\b", text)))[:8]
+            records = [f'("entity"<|>"{name.upper()}"<|>"CONCEPT"<|>"{name} as used in the text")' for name in names]
+            records += [
+                f'("relationship"<|>"{a.upper()}"<|>"{b.upper()}"<|>"{a} relates to {b}"<|>5)'
+                for a, b in zip(names, names[1:])
+            ]
+            return "##".join(records) + "<|COMPLETE|>"
+        if any("json" in message["content"].lower() for message in messages):
+            return json.dumps({
+                "title": "Community", "summary": "Summary.", "rating": 5.0, "rating_explanation": "Stub.",
+                "findings": [{"summary": "Finding", "explanation": "Explanation."}],
+                "points": [{"description": "Point.", "score": 50}],
+            })
+        return "Stub answer."
@@ -0,0 +1,120 @@
+import re
+
+import numpy as np
+
+import tracing
+
+SECTION_PATTERN = re.compile(
+    r"^\s*((\d+(\.\d+)*\.?|[IVX]+\.)\s+[A-Z][^\n]{0,80}"
+    r"|abstract|introduction|related work|background|method(s|ology)?|experiments?|results"
+    r"|discussion|conclusions?|limitations|references|bibliography|acknowledge?ments?|appendix)\s*$",
+    re.IGNORECASE
+)
+END_SECTIONS = ("references", "bibliography", "acknowledg")
+
+
+def split_sections(text):
+    """Splits extracted PDF text into (heading, body) pairs, dropping the bibliography onwards."""
+    sections, heading, lines = [], "", []
+    for line in text.splitlines():
+        if SECTION_PATTERN.match(line):
+            if lines:
+                sections.append((heading, "\n".join(lines)))
+            heading, lines = line.strip(), []
+            if heading.lower().strip(" .0123456789").startswith(END_SECTIONS):
+                return sections
+        else:
+            lines.append(line)
+    if lines:
+        sections.append((heading, "\n".join(lines)))
+    return sections
+
+
+def chunk_text(text, max_words=200):
+    """Section-aware chunks of at most `max_words` words, each prefixed with its section heading."""
+    chunks = []
+    for heading, body in split_sections(text):
+        words = body.split()
+        for start in range(0, len(words), max_words):
+            chunk = " ".join(words[start:start + max_words])
+            chunks.append(f"({heading}) {chunk}" if heading else chunk)
+    return chunks
+
+
+class ContextBuilder:
+    """
+    Packs references into a token budget measured with the generation model's tokenizer.
+
+    Every kept reference contributes its `[n]. Title:... Abstract:...` line;
+    the remaining budget is filled with the full-text chunks most similar to
+    the abstract under review. References are kept in rank order, so when the
+    headers alone overflow the budget the lowest ranked ones are dropped and
+    the `[n]` numbering stays contiguous.
+    """
+
+    def __init__(self, embedder, tokenizer, max_tokens=6000, chunk_words=200):
+        self.embedder = embedder
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.chunk_words = chunk_words
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _score_chunks(self, abstract, chunks):
+        output = self.embedder.encode(
+            [abstract] + chunks,
+            max_length=512,
+            return_dense=True,
+            return_sparse=False,
+            return_colbert_vecs=False
+        )
+        dense_vecs = np.asarray(output["dense_vecs"], dtype=np.float32)
+        return dense_vecs[1:] @ dense_vecs[0]
+
+    def build(self, abstract, references, full_texts):
+        """
+        references: ranked paper dicts; full_texts: {paperId: extracted text}.
+        Returns the reference context and the number of references it cites.
+        """
+        headers, used_tokens = [], 0
+        for idx, paper in enumerate(references):
+            header = f'[{idx}]. Title:{paper["title"]}. Abstract:{paper["abstract"]}\n'
+            n_tokens = self.count_tokens(header)
+            if used_tokens + n_tokens > self.max_tokens:
+                break
+            headers.append(header)
+            used_tokens += n_tokens
+        references = references[:len(headers)]
+
+        chunks, owners = [], []
+        for idx, paper in enumerate(references):
+            for chunk in chunk_text(full_texts.get(paper["paperId"], ""), self.chunk_words):
+                chunks.append(chunk)
+                owners.append(idx)
+        selected = {}
+        if chunks:
+            scores = self._score_chunks(abstract, chunks)
+            for i in np.argsort(-scores, kind="stable"):
+                n_tokens = self.count_tokens(chunks[i] + "\n")
+                if used_tokens + n_tokens > self.max_tokens:
+                    continue
+                selected[i] = scores[i]
+                used_tokens += n_tokens
+
+        while True:
+            context = self._assemble(headers, chunks, owners, selected)
+            # per-piece counts can differ slightly from the joined text, so check the final string
+            n_tokens = self.count_tokens(context)
+            if n_tokens <= self.max_tokens or not selected:
+                tracing.add("tokens", n_tokens)
+                return context, len(references)
+            del selected[min(selected, key=selected.get)]
+
+    def _assemble(self, headers, chunks, owners, selected):
+        parts = []
+        for idx, header in enumerate(headers):
+            parts.append(header)
+            # excerpts keep their original order inside the paper
+            parts.extend(chunks[i] + "\n" for i in sorted(i for i in selected if owners[i] == idx))
+        return "".join(parts)
@@ -0,0 +1,373 @@
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+FLOAT_ARRAYS = ("dense", "sparse_indptr", "sparse_indices", "sparse_values", "colbert", "colbert_offsets")
+QUANTIZED_ARRAYS = {
+    "int8": ("dense_int8", "dense_int8_scale", "colbert_int8", "colbert_int8_scale"),
+    "binary": ("dense_binary", "colbert_binary"),
+}
+# sign bits rank coarser than int8 codes, so more candidates are rescored
+OVERSAMPLE = {"int8": 4, "binary": 10}
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def format_paper(paper):
+    return f'Title:{paper["title"]}. Abstract:{paper["abstract"]}'
+
+
+def quantize_int8(vectors):
+    """Symmetric per-row int8 codes and the float scales that undo them."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scale = np.abs(vectors).max(axis=1) / 127 if len(vectors) else np.zeros(0, dtype=np.float32)
+    scale[scale == 0] = 1.0
+    codes = np.rint(vectors / scale[:, None]).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+def quantize_binary(vectors):
+    """Sign bits packed eight dimensions to a byte."""
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+
+def hamming_similarity(query_bits, bits, dim):
+    """1 - 2 * hamming / dim: the cosine of the sign vectors, between -1 and 1."""
+    distance = POPCOUNT[np.bitwise_xor(bits, query_bits)].sum(axis=-1, dtype=np.int32)
+    return 1.0 - 2.0 * distance.astype(np.float32) / dim
+
+
+class CorpusIndex:
+    """
+    Persistent BGE-M3 index over the paper corpus, keyed by paperId.
+
+    Every call to `add` encodes only the papers that are not indexed yet and
+    writes them as a new shard directory, so the corpus is encoded once and
+    grows incrementally. At query time only the query is encoded and the
+    dense / sparse / colbert scores are computed against the stored vectors.
+
+    Shards stay memory-mapped and scoring reads only the rows it is asked
+    for, so memory and time per query follow the number of scored papers,
+    not the corpus size.
+
+    With `quantization` set to "int8" or "binary", compressed dense and
+    colbert codes are stored next to the float vectors, memory-mapped the
+    same way, and searched instead (int8 dot products or Hamming
+    similarity); only the `oversample * top_k` best candidates of a search
+    are rescored with the float vectors, so the final scores equal the float
+    path's. A search that would rescore every candidate skips the codes, so
+    they are paged in only by passes that rank many more papers than they
+    keep.
+    """
+
+    def __init__(self, model, index_dir="./corpus_index", max_passage_length=2048, batch_size=100,
+                 quantization=None, oversample=None):
+        if quantization not in (None, *QUANTIZED_ARRAYS):
+            raise ValueError(f"unknown quantization {quantization!r}")
+        self.model = model
+        self.index_dir = Path(index_dir)
+        self.max_passage_length = max_passage_length
+        self.batch_size = batch_size
+        self.quantization = quantization
+        self.oversample = oversample or OVERSAMPLE.get(quantization)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+
+        self.ids = []
+        self.id2row = {}
+        self._shards = []
+        self._shard_starts = np.zeros(1, dtype=np.int64)
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, paper_id):
+        return paper_id in self.id2row
+
+    def _load(self):
+        for shard_dir in sorted(self.index_dir.glob("shard_*")):
+            if shard_dir.name.endswith(".tmp"):
+                continue
+            with open(shard_dir / "ids.json", "r") as file:
+                shard_ids = json.load(file)
+            self._append_shard(shard_ids, self._open_shard(shard_dir))
+
+    def _open_shard(self, shard_dir):
+        names = FLOAT_ARRAYS + QUANTIZED_ARRAYS.get(self.quantization, ())
+        if not all((shard_dir / f"{name}.npy").exists() for name in names):
+            # shards written without this quantization get their codes once; the float vectors
+            # read for them are unmapped again, so the scan does not stay resident
+            floats = {name: np.load(shard_dir / f"{name}.npy", mmap_mode="r") for name in ("dense", "colbert")}
+            for name, array in self._quantize(floats).items():
+                np.save(shard_dir / f"{name}.tmp.npy", array)
+                os.replace(shard_dir / f"{name}.tmp.npy", shard_dir / f"{name}.npy")
+            del floats
+        return {name: np.load(shard_dir / f"{name}.npy", mmap_mode="r") for name in names}
+
+    def _append_shard(self, shard_ids, shard):
+        self._shards.append(shard)
+        # readers pick up the new shard once its rows are mapped
+        self._shard_starts = np.append(self._shard_starts, self._shard_starts[-1] + len(shard_ids))
+        for paper_id in shard_ids:
+            self.id2row[paper_id] = len(self.ids)
+            self.ids.append(paper_id)
+
+    def _quantize(self, shard):
+        if self.quantization == "int8":
+            dense_codes, dense_scale = quantize_int8(shard["dense"])
+            colbert_codes, colbert_scale = quantize_int8(shard["colbert"])
+            return {
+                "dense_int8": dense_codes,
+                "dense_int8_scale": dense_scale,
+                "colbert_int8": colbert_codes,
+                "colbert_int8_scale": colbert_scale,
+            }
+        return {
+            "dense_binary": quantize_binary(shard["dense"]),
+            "colbert_binary": quantize_binary(shard["colbert"]),
+        }
+
+    def add(self, papers):
+        # requests served concurrently may add overlapping papers
+        with self._lock:
+            return self._add(papers)
+
+    def _add(self, papers):
+        new_papers, seen = [], set()
+        for paper in papers:
+            if paper["paperId"] in self.id2row or paper["paperId"] in seen:
+                continue
+            seen.add(paper["paperId"])
+            new_papers.append(paper)
+        if not new_papers:
+            return 0
+
+        output = self.model.encode(
+            [format_paper(paper) for paper in new_papers],
+            batch_size=self.batch_size,
+            max_length=self.max_passage_length,
+            return_dense=True,
+            return_sparse=True,
+            return_colbert_vecs=True
+        )
+        shard = self._build_shard(output)
+        if self.quantization is not None:
+            shard.update(self._quantize(shard))
+        shard_ids = [paper["paperId"] for paper in new_papers]
+        shard_dir = self._write_shard(shard_ids, shard)
+
+        # reopened memory-mapped, so the vectors do not stay resident
+        self._append_shard(shard_ids, self._open_shard(shard_dir))
+        return len(new_papers)
+
+    def _build_shard(self, output):
+        sparse_indptr, sparse_indices, sparse_values = [0], [], []
+        for weights in output["lexical_weights"]:
+            sparse_indices.extend(int(token) for token in weights)
+            sparse_values.extend(float(value) for value in weights.values())
+            sparse_indptr.append(len(sparse_indices))
+
+        colbert_vecs = [np.asarray(vecs, dtype=np.float32) for vecs in output["colbert_vecs"]]
+        colbert_offsets = np.zeros(len(colbert_vecs) + 1, dtype=np.int64)
+        colbert_offsets[1:] = np.cumsum([len(vecs) for vecs in colbert_vecs])
+
+        return {
+            "dense": np.asarray(output["dense_vecs"], dtype=np.float32),
+            "sparse_indptr": np.asarray(sparse_indptr, dtype=np.int64),
+            "sparse_indices": np.asarray(sparse_indices, dtype=np.int32),
+            "sparse_values": np.asarray(sparse_values, dtype=np.float32),
+            "colbert": np.concatenate(colbert_vecs),
+            "colbert_offsets": colbert_offsets,
+        }
+
+    def _write_shard(self, shard_ids, shard):
+        shard_dir = self.index_dir / f"shard_{len(self._shards):05d}"
+        tmp_dir = self.index_dir / f"{shard_dir.name}.tmp"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir()
+        for name, array in shard.items():
+            np.save(tmp_dir / f"{name}.npy", array)
+        with open(tmp_dir / "ids.json", "w") as file:
+            json.dump(shard_ids, file)
+        os.replace(tmp_dir, shard_dir)
+        return shard_dir
+
+    def _by_shard(self, rows):
+        """Yields (shard, rows within the shard, positions in `rows`) for every shard `rows` touch."""
+        starts, shards = self._shard_starts, self._shards
+        shard_of = np.searchsorted(starts, rows, side="right") - 1
+        order = np.argsort(shard_of, kind="stable")
+        for positions in np.split(order, np.flatnonzero(np.diff(shard_of[order])) + 1):
+            if len(positions):
+                shard_index = shard_of[positions[0]]
+                yield shards[shard_index], rows[positions] - starts[shard_index], positions
+
+    def mapped_bytes(self, names=None):
+        """Size of the memory-mapped shard arrays (only `names` if given), paged in only where rows are scored."""
+        return sum(
+            array.nbytes for shard in self._shards for name, array in shard.items()
+            if names is None or name in names
+        )
+
+    def encode_query(self, query, max_query_length=512):
+        output = self.model.encode(
+            [query],
+            max_length=max_query_length,
+            return_dense=True,
+            return_sparse=True,
+            return_colbert_vecs=True
+        )
+        lexical_weights = output["lexical_weights"][0]
+        return {
+            "dense": np.asarray(output["dense_vecs"][0], dtype=np.float32),
+            "sparse_indices": np.asarray([int(token) for token in lexical_weights], dtype=np.int32),
+            "sparse_values": np.asarray(list(lexical_weights.values()), dtype=np.float32),
+            "colbert": np.asarray(output["colbert_vecs"][0], dtype=np.float32),
+        }
+
+    def rows(self, paper_ids):
+        return np.asarray([self.id2row[paper_id] for paper_id in paper_ids], dtype=np.int64)
+
+    def dense_scores(self, encoded_query, rows, exact=False):
+        query = encoded_query["dense"]
+        quantization = None if exact else self.quantization
+        query_bits = quantize_binary(query) if quantization == "binary" else None
+        scores = np.empty(len(rows), dtype=np.float32)
+        for shard, local, positions in self._by_shard(rows):
+            if quantization is None:
+                scores[positions] = np.asarray(shard["dense"][local]) @ query
+            elif quantization == "int8":
+                codes = shard["dense_int8"][local].astype(np.float32)
+                scores[positions] = (codes @ query) * shard["dense_int8_scale"][local]
+            else:
+                scores[positions] = hamming_similarity(query_bits, shard["dense_binary"][local], len(query))
+        return scores
+
+    def sparse_scores(self, encoded_query, rows):
+        order = np.argsort(encoded_query["sparse_indices"])
+        query_tokens = encoded_query["sparse_indices"][order]
+        query_values = encoded_query["sparse_values"][order]
+        scores = np.zeros(len(rows), dtype=np.float32)
+        if len(query_tokens) == 0:
+            return scores
+
+        # only the lexical weights of the requested rows are touched
+        for shard, local, positions in self._by_shard(rows):
+            indptr = shard["sparse_indptr"]
+            entries, lengths = _ranges(indptr[local], indptr[local + 1])
+            entry_rows = np.repeat(np.arange(len(local)), lengths)
+            tokens = np.asarray(shard["sparse_indices"][entries])
+            mask = np.isin(tokens, query_tokens)
+            positions_in_query = np.searchsorted(query_tokens, tokens[mask])
+            scores[positions] = np.bincount(
+                entry_rows[mask],
+                weights=shard["sparse_values"][entries[mask]] * query_values[positions_in_query],
+                minlength=len(local)
+            )
+        return scores
+
+    def colbert_scores(self, encoded_query, rows, exact=False, block_tokens=65536):
+        query_vecs = encoded_query["colbert"]
+        quantization = None if exact else self.quantization
+        query_bits = quantize_binary(query_vecs) if quantization == "binary" else None
+        scores = np.empty(len(rows), dtype=np.float32)
+        for shard, local, positions in self._by_shard(rows):
+            if quantization is None:
+                similarity = lambda token_index: query_vecs @ np.asarray(shard["colbert"][token_index]).T
+            elif quantization == "int8":
+                similarity = lambda token_index: (
+                    (query_vecs @ shard["colbert_int8"][token_index].T.astype(np.float32))
+                    * shard["colbert_int8_scale"][token_index]
+                )
+            else:
+                similarity = lambda token_index: np.stack([
+                    hamming_similarity(q, shard["colbert_binary"][token_index], query_vecs.shape[1])
+                    for q in query_bits
+                ])
+            scores[positions] = _maxsim(similarity, shard["colbert_offsets"], local, len(query_vecs), block_tokens)
+        return scores
+
+    def score(self, query, paper_ids, weights_for_different_modes=(0.4, 0.2, 0.4), encoded_query=None, exact=None):
+        """
+        Same weighting as `BGEM3FlagModel.compute_score(...)['colbert+sparse+dense']`.
+        Modes with a zero weight are not computed, so `(1, 0, 0)` is a dense-only pass.
+        A quantized index scores with its codes unless `exact` is set.
+        """
+        if encoded_query is None:
+            encoded_query = self.encode_query(query)
+        rows = self.rows(paper_ids)
+        w_dense, w_sparse, w_colbert = weights_for_different_modes
+        scores = np.zeros(len(rows), dtype=np.float32)
+        if w_dense:
+            scores += w_dense * self.dense_scores(encoded_query, rows, exact)
+        if w_sparse:
+            scores += w_sparse * self.sparse_scores(encoded_query, rows)
+        if w_colbert:
+            scores += w_colbert * self.colbert_scores(encoded_query, rows, exact)
+        return scores / (w_dense + w_sparse + w_colbert)
+
+    def search(self, query, paper_ids, weights_for_different_modes=(0.4, 0.2, 0.4), encoded_query=None, top_k=None):
+        """
+        Papers sorted by score, only the best `top_k` if given. A quantized
+        index ranks with its codes first and rescores the best
+        `oversample * top_k` candidates with the float vectors.
+        """
+        paper_ids = list(paper_ids)
+        if not paper_ids:
+            return [], []
+        if encoded_query is None:
+            encoded_query = self.encode_query(query)
+        if self.quantization is not None:
+            n_rescore = len(paper_ids) if top_k is None else min(len(paper_ids), self.oversample * top_k)
+            if n_rescore < len(paper_ids):
+                candidates = _top(self.score(query, paper_ids, weights_for_different_modes, encoded_query), n_rescore)
+            else:
+                # every paper would be rescored, so the codes are skipped
+                candidates = np.arange(len(paper_ids))
+            paper_ids = [paper_ids[i] for i in candidates]
+        scores = self.score(query, paper_ids, weights_for_different_modes, encoded_query, exact=True)
+        order = _top(scores, len(paper_ids) if top_k is None else top_k)
+        return [paper_ids[i] for i in order], scores[order].tolist()
+
+
+def _top(scores, k):
+    """Indices of the `k` best scores, best first; ties keep their input order."""
+    if k < len(scores):
+        candidates = np.sort(np.argpartition(-scores, k - 1)[:k]) if k > 0 else np.zeros(0, dtype=np.int64)
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+    return np.argsort(-scores, kind="stable")
+
+
+def _maxsim(similarity, offsets, rows, n_query_tokens, block_tokens):
+    """
+    ColBERT late interaction: for every row, the mean over query tokens of the
+    best `similarity(token_index)` among the row's tokens.
+    """
+    scores = np.zeros(len(rows), dtype=np.float32)
+    # group rows so that a single similarity block stays bounded in memory
+    row_tokens = np.cumsum(offsets[rows + 1] - offsets[rows])
+    start = 0
+    while start < len(rows):
+        base = row_tokens[start - 1] if start > 0 else 0
+        end = max(start + 1, int(np.searchsorted(row_tokens, base + block_tokens, side="right")))
+        block_rows = rows[start:end]
+        token_index, lengths = _ranges(offsets[block_rows], offsets[block_rows + 1])
+        block_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        max_sim = np.maximum.reduceat(similarity(token_index), block_starts, axis=1)
+        scores[start:end] = max_sim.sum(axis=0) / n_query_tokens
+        start = end
+    return scores
+
+
+def _ranges(starts, ends):
+    """Concatenation of `arange(start, end)` for every pair, plus the range lengths."""
+    lengths = np.asarray(ends - starts, dtype=np.int64)
+    total = int(lengths.sum())
+    range_starts = np.cumsum(lengths) - lengths
+    index = np.repeat(np.asarray(starts, dtype=np.int64) - range_starts, lengths) + np.arange(total)
+    return index, lengths
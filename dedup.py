@@ -0,0 +1,107 @@
+import re
+import unicodedata
+
+import numpy as np
+
+from corpus_index import format_paper
+
+
+def normalize(text):
+    """Lowercase ASCII words: accents, punctuation and spacing differences are dropped."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def shingles(text, size=3):
+    """32-bit hashes of the overlapping word `size`-grams of the normalized text."""
+    # str hashes are salted per process, which is fine as signatures are never stored
+    words = normalize(text).split() or [""]
+    words = np.fromiter(map(hash, words), dtype=np.int64, count=len(words)).view(np.uint64)
+    n_grams = max(len(words) - size + 1, 1)
+    # polynomial combination of the word hashes, wrapping in 64 bits
+    hashes = np.zeros(n_grams, dtype=np.uint64)
+    for i in range(min(size, len(words))):
+        hashes = hashes * np.uint64(1000003) + words[i:i + n_grams]
+    return np.unique(hashes & np.uint64(0xFFFFFFFF))
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, seed=0):
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: the high 32 bits of a * x + b, with a odd
+        self.a = rng.integers(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, text):
+        return ((self.a * shingles(text) + self.b) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+class Deduplicator:
+    """
+    Collapses near-duplicate papers in a stream of search results: a preprint
+    and its published version, or the same work listed by two repositories.
+
+    Two papers are duplicates when their normalized titles match (for titles
+    of at least `min_title_words` words) or when the estimated Jaccard
+    similarity of the word shingles of their `Title:...Abstract:...` strings
+    reaches `threshold`. Candidates are found with MinHash LSH: signatures of
+    `num_perm` hashes split into `bands` buckets.
+
+    The first record of a work is kept, as a copy. Later duplicates are
+    merged into it: it keeps the highest citationCount and gains an
+    open-access URL if it had none.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, min_title_words=4):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.min_title_words = min_title_words
+        self.hasher = MinHasher(num_perm)
+        self.records = []
+        self._signatures = []
+        self._titles = {}
+        self._buckets = [{} for _ in range(bands)]
+
+    def add(self, paper):
+        """Returns (record, is_new); `record` is the kept copy the paper was merged into."""
+        title = normalize(paper["title"])
+        if len(title.split()) >= self.min_title_words and title in self._titles:
+            record = self.records[self._titles[title]]
+            merge_into(record, paper)
+            return record, False
+
+        signature = self.hasher.signature(format_paper(paper))
+        keys = [band.tobytes() for band in signature.reshape(self.bands, -1)]
+        candidates = {i for bucket, key in zip(self._buckets, keys) for i in bucket.get(key, ())}
+        for i in sorted(candidates):
+            if np.mean(self._signatures[i] == signature) >= self.threshold:
+                merge_into(self.records[i], paper)
+                return self.records[i], False
+
+        index = len(self.records)
+        record = dict(paper)
+        self.records.append(record)
+        self._signatures.append(signature)
+        if len(title.split()) >= self.min_title_words:
+            self._titles[title] = index
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(index)
+        return record, True
+
+
+def merge_into(record, duplicate):
+    if (duplicate.get("citationCount") or 0) > (record.get("citationCount") or 0):
+        record["citationCount"] = duplicate["citationCount"]
+    if not record.get("url") and duplicate.get("url"):
+        record["url"] = duplicate["url"]
+        record["isOpenAccess"] = duplicate.get("isOpenAccess")
+
+
+def deduplicate(papers, **options):
+    """Unique papers in first-seen order, duplicates merged in."""
+    deduplicator = Deduplicator(**options)
+    for paper in papers:
+        deduplicator.add(paper)
+    return deduplicator.records
@@ -1,11 +1,23 @@
 import os
 import sys
+import atexit
+import asyncio
+import hashlib
 import logging
+import sqlite3
+import threading
+import weakref
 import ollama
 import numpy as np
+from dataclasses import asdict
 from nano_graphrag import GraphRAG, QueryParam
 from nano_graphrag.base import BaseKVStorage
-from nano_graphrag._utils import compute_args_hash, wrap_embedding_func_with_attrs
+from nano_graphrag.prompt import PROMPTS
+from nano_graphrag._op import get_chunks, _community_report_json_to_str, _pack_single_community_describe
+from nano_graphrag._utils import compute_args_hash, compute_mdhash_id, logger, wrap_embedding_func_with_attrs
+from graph_storage import NumpyVectorStorage, SQLiteKVStorage, TrackedNetworkXStorage
+from llm_cache import LLMCache
+import tracing
 
 logging.basicConfig(level=logging.WARNING)
 logging.getLogger("nano-graphrag").setLevel(logging.INFO)
@@ -18,6 +30,68 @@ MODEL = "qwen3:8b"
 EMBEDDING_MODEL = "nomic-embed-text:latest"
 EMBEDDING_MODEL_DIM = 768
 EMBEDDING_MODEL_MAX_TOKENS = 8192
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_CONCURRENCY = 4
+LLM_CACHE_ENTRIES = 4096
+
+# ollama clients and semaphores are bound to the event loop that created them
+_loop_state = weakref.WeakKeyDictionary()
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+llm_cache = LLMCache(max_entries=LLM_CACHE_ENTRIES)
+
+
+def _get_loop_state():
+    loop = asyncio.get_running_loop()
+    if loop not in _loop_state:
+        _loop_state[loop] = {
+            "client": ollama.AsyncClient(),
+            "embedding_slots": asyncio.Semaphore(EMBEDDING_CONCURRENCY),
+        }
+    return _loop_state[loop]
+
+
+class EmbeddingCache:
+    """SQLite cache of embedding vectors keyed by a hash of model and text."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def put_many(self, items):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+            )
+
+
+def _get_embedding_cache():
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            os.makedirs(WORKING_DIR, exist_ok=True)
+            _embedding_cache = EmbeddingCache(os.path.join(WORKING_DIR, "embedding_cache.sqlite"))
+    return _embedding_cache
 
 
 async def ollama_model_if_cache(
@@ -27,29 +101,97 @@ async def ollama_model_if_cache(
     kwargs.pop("max_tokens", None)
     kwargs.pop("response_format", None)
 
-    ollama_client = ollama.AsyncClient()
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
 
-    # Get the cached response if having-------------------
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
     messages.extend(history_messages)
     messages.append({"role": "user", "content": prompt})
-    if hashing_kv is not None:
-        args_hash = compute_args_hash(MODEL, messages)
-        if_cache_return = await hashing_kv.get_by_id(args_hash)
-        if if_cache_return is not None:
-            return if_cache_return["return"]
-    # -----------------------------------------------------
-    response = await ollama_client.chat(model=MODEL, messages=messages, **kwargs)
-
-    result = response["message"]["content"]
-    # Cache the response if having-------------------
-    if hashing_kv is not None:
-        await hashing_kv.upsert({args_hash: {"return": result, "model": MODEL}})
-    # -----------------------------------------------------
-    return result
+
+    async def generate():
+        response = await _get_loop_state()["client"].chat(model=MODEL, messages=messages, **kwargs)
+        return response["message"]["content"]
+
+    # memory LRU, then hashing_kv if given; identical concurrent prompts share one generation
+    return await llm_cache.get_or_compute(
+        compute_args_hash(MODEL, messages), generate, store=hashing_kv, model=MODEL
+    )
+
+
+async def update_community_reports(community_reports, graph, global_config, changed_nodes, changed_edges):
+    """
+    Regenerates the reports of communities whose membership changed or that
+    contain a changed node or edge, deepest level first so parents see their
+    sub-communities' new reports. Every other community keeps its report.
+    Returns the number of regenerated reports.
+    """
+    schema = await graph.community_schema()
+    old_keys = await community_reports.all_keys()
+    old_reports = {}
+    for report in await community_reports.get_by_ids(old_keys):
+        if report is not None:
+            old_reports[(report["level"], frozenset(report["nodes"]))] = report
+
+    def is_unchanged(community, old):
+        return (
+            old is not None
+            and {tuple(sorted(e)) for e in old["edges"]} == {tuple(sorted(e)) for e in community["edges"]}
+            and changed_nodes.isdisjoint(community["nodes"])
+            and not any(tuple(sorted(e)) in changed_edges for e in community["edges"])
+        )
+
+    async def form_report(community, already_reports):
+        describe = await _pack_single_community_describe(
+            graph,
+            community,
+            max_token_size=global_config["best_model_max_token_size"],
+            already_reports=already_reports,
+            global_config=global_config,
+        )
+        prompt = PROMPTS["community_report"].format(input_text=describe)
+        response = await global_config["best_model_func"](
+            prompt, **global_config["special_community_report_llm_kwargs"]
+        )
+        return global_config["convert_response_to_json_func"](response)
+
+    community_datas, updates, regenerated = {}, {}, set()
+    for level in sorted({c["level"] for c in schema.values()}, reverse=True):
+        to_generate = []
+        for key, community in schema.items():
+            if community["level"] != level:
+                continue
+            old = old_reports.get((level, frozenset(community["nodes"])))
+            if is_unchanged(community, old) and regenerated.isdisjoint(community["sub_communities"]):
+                community_datas[key] = {
+                    "report_string": old["report_string"],
+                    "report_json": old["report_json"],
+                    **community,
+                }
+                # cluster ids can shift between runs even when the members do not
+                if old["title"] != community["title"] or sorted(old["sub_communities"]) != sorted(community["sub_communities"]):
+                    updates[key] = community_datas[key]
+            else:
+                to_generate.append((key, community))
+        reports = await asyncio.gather(*[form_report(c, community_datas) for _, c in to_generate])
+        for (key, community), report in zip(to_generate, reports):
+            community_datas[key] = {
+                "report_string": _community_report_json_to_str(report),
+                "report_json": report,
+                **community,
+            }
+            updates[key] = community_datas[key]
+            regenerated.add(key)
+
+    logger.info(f"Regenerated {len(regenerated)} of {len(schema)} community reports")
+    stale = [key for key in old_keys if key not in schema]
+    if hasattr(community_reports, "delete"):
+        await community_reports.delete(stale)
+        await community_reports.upsert(updates)
+    else:
+        await community_reports.drop()
+        await community_reports.upsert(community_datas)
+    return len(regenerated)
 
 
 def remove_if_exist(file):
@@ -57,39 +199,189 @@ def remove_if_exist(file):
         os.remove(file)
 
 
-def query(query:str, mode:str='global'):
-    rag = GraphRAG(
-        working_dir=WORKING_DIR,
-        best_model_func=ollama_model_if_cache,
-        cheap_model_func=ollama_model_if_cache,
-        embedding_func=ollama_embedding,
-    )
+class GraphRAGSession:
+    """
+    Long-lived GraphRAG instance that keeps its stores in memory between calls.
+
+    All calls run on one background event loop, so the pooled ollama client
+    and the storages are shared by every insert and query. Instead of
+    rewriting every store after each call, dirty state is flushed every
+    `flush_interval` seconds and on `close()`. Inserts are serialized;
+    queries run concurrently with each other.
+    """
+
+    def __init__(self, working_dir=WORKING_DIR, flush_interval=30.0, **graph_kwargs):
+        self.flush_interval = flush_interval
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="graph-rag-loop", daemon=True)
+        self._thread.start()
+        self._index_dirty = False
+        self._query_dirty = False
+        self._closed = False
+        self._run(self._start(working_dir, graph_kwargs))
+
+    async def _start(self, working_dir, graph_kwargs):
+        self.rag = GraphRAG(
+            working_dir=working_dir,
+            enable_llm_cache=True,
+            best_model_func=ollama_model_if_cache,
+            cheap_model_func=ollama_model_if_cache,
+            embedding_func=ollama_embedding,
+            key_string_value_json_storage_cls=SQLiteKVStorage,
+            vector_db_storage_cls=NumpyVectorStorage,
+            graph_storage_cls=TrackedNetworkXStorage,
+            **graph_kwargs
+        )
+        # GraphRAG rewrites its stores after every call; mark them dirty and flush later instead
+        self._write_index = self.rag._insert_done
+        self._write_query = self.rag._query_done
+        self.rag._insert_done = self._mark_index_dirty
+        self.rag._query_done = self._mark_query_dirty
+        self._insert_lock = asyncio.Lock()
+        self._flusher = asyncio.create_task(self._flush_periodically())
 
-    response = rag.query(query, param=QueryParam(mode=mode))
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _mark_index_dirty(self):
+        self._index_dirty = True
+
+    async def _mark_query_dirty(self):
+        self._query_dirty = True
+
+    async def _flush(self):
+        # holding the insert lock keeps half-finished inserts off disk
+        async with self._insert_lock:
+            if self._index_dirty:
+                # also covers the llm response cache
+                self._index_dirty = self._query_dirty = False
+                await self._write_index()
+            elif self._query_dirty:
+                self._query_dirty = False
+                await self._write_query()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._flush()
+            except Exception as e:
+                logging.getLogger("nano-graphrag").warning(f"GraphRAG flush failed: {e}")
+
+    async def _ainsert(self, string_or_strings):
+        """
+        Same steps as `GraphRAG.ainsert`, except that community reports are
+        kept and only the communities touched by the new text are summarized again.
+        """
+        rag = self.rag
+        async with self._insert_lock:
+            await rag._insert_start()
+            try:
+                if isinstance(string_or_strings, str):
+                    string_or_strings = [string_or_strings]
+                # documents and chunks are keyed by content hash, so text seen before is skipped
+                new_docs = {
+                    compute_mdhash_id(c.strip(), prefix="doc-"): {"content": c.strip()}
+                    for c in string_or_strings
+                }
+                _add_doc_keys = await rag.full_docs.filter_keys(list(new_docs.keys()))
+                new_docs = {k: v for k, v in new_docs.items() if k in _add_doc_keys}
+                if not len(new_docs):
+                    logger.warning("All docs are already in the storage")
+                    return
+                logger.info(f"[New Docs] inserting {len(new_docs)} docs")
+
+                inserting_chunks = get_chunks(
+                    new_docs=new_docs,
+                    chunk_func=rag.chunk_func,
+                    overlap_token_size=rag.chunk_overlap_token_size,
+                    max_token_size=rag.chunk_token_size,
+                )
+                _add_chunk_keys = await rag.text_chunks.filter_keys(list(inserting_chunks.keys()))
+                inserting_chunks = {k: v for k, v in inserting_chunks.items() if k in _add_chunk_keys}
+                if not len(inserting_chunks):
+                    logger.warning("All chunks are already in the storage")
+                    return
+                logger.info(f"[New Chunks] inserting {len(inserting_chunks)} chunks")
+                if rag.enable_naive_rag:
+                    await rag.chunks_vdb.upsert(inserting_chunks)
+
+                graph = rag.chunk_entity_relation_graph
+                graph.reset_changes()
+                logger.info("[Entity Extraction]...")
+                maybe_new_kg = await rag.entity_extraction_func(
+                    inserting_chunks,
+                    knwoledge_graph_inst=graph,
+                    entity_vdb=rag.entities_vdb,
+                    global_config=asdict(rag),
+                )
+                if maybe_new_kg is None:
+                    logger.warning("No new entities found")
+                    return
+
+                logger.info("[Community Report]...")
+                # Leiden still runs over the whole graph; only the summaries are incremental
+                await graph.clustering(rag.graph_cluster_algorithm)
+                await update_community_reports(
+                    rag.community_reports, graph, asdict(rag), graph.changed_nodes, graph.changed_edges
+                )
+
+                await rag.full_docs.upsert(new_docs)
+                await rag.text_chunks.upsert(inserting_chunks)
+            finally:
+                await rag._insert_done()
+
+    def insert(self, message):
+        return self._run(self._ainsert(message))
+
+    def query(self, query, mode="global"):
+        return self._run(self.rag.aquery(query, param=QueryParam(mode=mode)))
+
+    def flush(self):
+        self._run(self._flush())
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._flusher.cancel()
+        self._run(self._flush())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = GraphRAGSession()
+            atexit.register(_session.close)
+        return _session
+
+
+def query(query:str, mode:str='global'):
+    response = get_session().query(query, mode=mode)
     return response
 
 def insert(message:str):
-    from time import time
-
     # with open("./test3.txt", encoding="utf-8-sig") as f:
     #     FAKE_TEXT = f.read()
 
-    # remove_if_exist(f"{WORKING_DIR}/vdb_entities.json")
-    # remove_if_exist(f"{WORKING_DIR}/kv_store_full_docs.json")
-    # remove_if_exist(f"{WORKING_DIR}/kv_store_text_chunks.json")
-    # remove_if_exist(f"{WORKING_DIR}/kv_store_community_reports.json")
-    # remove_if_exist(f"{WORKING_DIR}/graph_chunk_entity_relation.graphml")
-
-    rag = GraphRAG(
-        working_dir=WORKING_DIR,
-        enable_llm_cache=True,
-        best_model_func=ollama_model_if_cache,
-        cheap_model_func=ollama_model_if_cache,
-        embedding_func=ollama_embedding,
-    )
-    start = time()
-    rag.insert(message)
-    print("indexing time:", time() - start)
+    with tracing.tracer.span("graph_rag.insert", chars=len(message)) as span:
+        before = llm_cache.stats()
+        get_session().insert(message)
+        stats = llm_cache.stats()
+        misses = stats["misses"] - before["misses"]
+        lookups = sum(stats[kind] - before[kind] for kind in ("memory_hits", "store_hits", "shared")) + misses
+        span.add("cache_hits", lookups - misses)
+        span.add("cache_misses", misses)
+    print("indexing time:", span.duration)
+    print("llm cache:", stats)
     # rag = GraphRAG(working_dir=WORKING_DIR, enable_llm_cache=True)
     # rag.insert(FAKE_TEXT[half_len:])
 
@@ -100,12 +392,39 @@ def insert(message:str):
     max_token_size=EMBEDDING_MODEL_MAX_TOKENS,
 )
 async def ollama_embedding(texts: list[str]) -> np.ndarray:
-    embed_text = []
-    for text in texts:
-        data = ollama.embeddings(model=EMBEDDING_MODEL, prompt=text)
-        embed_text.append(data["embedding"])
+    # sqlite calls run in a worker thread so they do not block the event loop
+    cache = await asyncio.to_thread(_get_embedding_cache)
+    keys = [EmbeddingCache.make_key(EMBEDDING_MODEL, text) for text in texts]
+    vectors = await asyncio.to_thread(cache.get_many, list(set(keys)))
+
+    # identical texts are embedded once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors:
+            missing[key] = text
+    if missing:
+        state = _get_loop_state()
+        missing_keys = list(missing)
+        batches = [
+            missing_keys[start:start + EMBEDDING_BATCH_SIZE]
+            for start in range(0, len(missing_keys), EMBEDDING_BATCH_SIZE)
+        ]
+
+        async def embed_batch(batch):
+            async with state["embedding_slots"]:
+                response = await state["client"].embed(
+                    model=EMBEDDING_MODEL,
+                    input=[missing[key] for key in batch]
+                )
+            return dict(zip(batch, response["embeddings"]))
+
+        new_vectors = {}
+        for result in await asyncio.gather(*[embed_batch(batch) for batch in batches]):
+            new_vectors.update(result)
+        await asyncio.to_thread(cache.put_many, new_vectors)
+        vectors.update(new_vectors)
 
-    return embed_text
+    return np.array([vectors[key] for key in keys], dtype=np.float32)
 
 
 if __name__ == "__main__":
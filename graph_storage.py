@@ -0,0 +1,349 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+from nano_graphrag._utils import load_json, logger
+from nano_graphrag._storage import NetworkXStorage
+from nano_graphrag.base import BaseKVStorage, BaseVectorStorage
+from nano_vectordb.dbs import load_storage
+
+# SQLite caps the number of bound parameters per statement
+SQL_BATCH_SIZE = 500
+
+
+@dataclass
+class SQLiteKVStorage(BaseKVStorage):
+    """
+    GraphRAG key-value store backed by one SQLite file per namespace.
+
+    Records are JSON-encoded rows, so point reads and upserts touch only the
+    rows involved instead of loading and rewriting the whole store. An
+    existing `kv_store_<namespace>.json` is imported once when the database
+    is first created.
+    """
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(working_dir, f"kv_store_{self.namespace}.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self._file_name, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+        self._migrate(os.path.join(working_dir, f"kv_store_{self.namespace}.json"))
+        n_rows, = self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()
+        logger.info(f"Load KV {self.namespace} with {n_rows} data")
+
+    def _migrate(self, json_file):
+        if self._conn.execute("SELECT 1 FROM meta WHERE name = 'migrated_from'").fetchone():
+            return
+        data = load_json(json_file) or {}
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False)) for key, value in data.items()]
+            )
+            self._conn.execute(
+                "INSERT INTO meta (name, value) VALUES ('migrated_from', ?)", (json_file,)
+            )
+        if data:
+            logger.info(f"Migrated {len(data)} records from {json_file}")
+
+    def _select(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQL_BATCH_SIZE):
+                batch = keys[start:start + SQL_BATCH_SIZE]
+                found.update(self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return found
+
+    # sqlite calls run in a worker thread so they do not block the event loop
+    async def all_keys(self) -> list[str]:
+        return await asyncio.to_thread(self._all_keys)
+
+    def _all_keys(self):
+        with self._lock:
+            return [key for key, in self._conn.execute("SELECT key FROM kv")]
+
+    async def get_by_id(self, id):
+        return await asyncio.to_thread(self._get_by_id, id)
+
+    def _get_by_id(self, id):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def get_by_ids(self, ids, fields=None):
+        found = await asyncio.to_thread(self._select, list(set(ids)))
+        results = []
+        for id in ids:
+            value = json.loads(found[id]) if id in found else None
+            if value is not None and fields is not None:
+                value = {k: v for k, v in value.items() if k in fields}
+            results.append(value)
+        return results
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        found = await asyncio.to_thread(self._select, list(set(data)))
+        return set([s for s in data if s not in found])
+
+    async def upsert(self, data: dict[str, dict]):
+        rows = [(key, json.dumps(value, ensure_ascii=False)) for key, value in data.items()]
+        await asyncio.to_thread(self._upsert, rows)
+
+    def _upsert(self, rows):
+        # one transaction per batch of records
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", rows)
+
+    async def delete(self, ids: list[str]):
+        await asyncio.to_thread(self._delete, ids)
+
+    def _delete(self, ids):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM kv WHERE key = ?", [(id,) for id in ids])
+
+    async def drop(self):
+        await asyncio.to_thread(self._drop)
+
+    def _drop(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM kv")
+
+    async def index_done_callback(self):
+        await asyncio.to_thread(self.compact)
+
+    def compact(self, vacuum=None):
+        """
+        Folds the write-ahead log back into the database file. With
+        `vacuum=None` the file is also rebuilt once more than half of its
+        pages are free, e.g. after community reports were dropped.
+        """
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if vacuum is None:
+                free_pages, = self._conn.execute("PRAGMA freelist_count").fetchone()
+                n_pages, = self._conn.execute("PRAGMA page_count").fetchone()
+                vacuum = free_pages * 2 > n_pages
+            if vacuum:
+                self._conn.execute("VACUUM")
+
+
+@dataclass
+class NumpyVectorStorage(BaseVectorStorage):
+    """
+    GraphRAG vector store kept in a memory-mapped `.npy` matrix.
+
+    Normalized vectors live in `vdb_<namespace>.npy`, which is preallocated
+    and doubled when full so new vectors are written in place; ids and meta
+    fields go to an append-only `vdb_<namespace>.meta.jsonl` sidecar, which
+is rewritten once most of its lines are superseded versions. Loading
+    maps the matrix without parsing it, and queries are a blocked matrix
+    product with a running top-k. The dtype (`float32` or `float16`) and the
+    query block size are read from `vector_db_storage_cls_kwargs`. An
+    existing nano-vectordb `vdb_<namespace>.json` is imported on first open.
+    """
+
+    cosine_better_than_threshold: float = 0.2
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        options = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        self._matrix_file = os.path.join(working_dir, f"vdb_{self.namespace}.npy")
+        self._meta_file = os.path.join(working_dir, f"vdb_{self.namespace}.meta.jsonl")
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._block_rows = options.get("block_rows", 65536)
+        self.cosine_better_than_threshold = self.global_config.get(
+            "query_better_than_threshold", self.cosine_better_than_threshold
+        )
+        self._dim = self.embedding_func.embedding_dim
+        self._dtype = np.dtype(options.get("dtype", "float32"))
+        self._matrix = None
+        self._rows = {}
+        self._records = []
+        self._pending = []
+        # lines in the sidecar, including superseded versions of a row
+        self._meta_lines = 0
+        if os.path.exists(self._matrix_file):
+            self._matrix = np.load(self._matrix_file, mmap_mode="r+")
+            self._dtype = self._matrix.dtype
+            self._load_meta()
+        else:
+            self._migrate(os.path.join(working_dir, f"vdb_{self.namespace}.json"))
+        logger.info(f"Load vectors {self.namespace} with {len(self._records)} data")
+
+    def _load_meta(self):
+        if not os.path.exists(self._meta_file):
+            return
+        with open(self._meta_file, "r", encoding="utf-8") as file:
+            for line in file:
+                self._meta_lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write from an interrupted flush
+                    continue
+                row = record.pop("__row__")
+                if row >= len(self._matrix):
+                    continue
+                self._records.extend([None] * (row + 1 - len(self._records)))
+                # later lines describe newer versions of the same row
+                self._records[row] = record
+                self._rows[record["__id__"]] = row
+
+    def _migrate(self, json_file):
+        storage = load_storage(json_file)
+        if storage is None or not storage["data"]:
+            return
+        records = [
+            {k: v for k, v in record.items() if k == "__id__" or k in self.meta_fields}
+            for record in storage["data"]
+        ]
+        self._write(records, storage["matrix"])
+        self._flush()
+        logger.info(f"Migrated {len(records)} vectors from {json_file}")
+
+    def _ensure_capacity(self, n_rows):
+        capacity = 0 if self._matrix is None else len(self._matrix)
+        if n_rows <= capacity:
+            return
+        tmp_file = self._matrix_file + ".tmp"
+        matrix = np.lib.format.open_memmap(
+            tmp_file, mode="w+", dtype=self._dtype, shape=(max(n_rows, 2 * capacity, 1024), self._dim)
+        )
+        if self._matrix is not None:
+            matrix[:len(self._records)] = self._matrix[:len(self._records)]
+        matrix.flush()
+        del matrix
+        os.replace(tmp_file, self._matrix_file)
+        self._matrix = np.load(self._matrix_file, mmap_mode="r+")
+
+    def _write(self, records, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        rows, new_rows = [], {}
+        for record in records:
+            row = self._rows.get(record["__id__"])
+            if row is None:
+                row = new_rows.setdefault(record["__id__"], len(self._records) + len(new_rows))
+            rows.append(row)
+        self._ensure_capacity(max(rows) + 1)
+        self._matrix[rows] = vectors.astype(self._dtype)
+        self._records.extend([None] * (max(rows) + 1 - len(self._records)))
+        for row, record in zip(rows, records):
+            self._records[row] = record
+            self._rows[record["__id__"]] = row
+            self._pending.append({"__row__": row, **record})
+
+    def _flush(self):
+        if self._matrix is not None:
+            self._matrix.flush()
+        if self._pending:
+            # vectors are on disk before the sidecar refers to them
+            with open(self._meta_file, "a", encoding="utf-8") as file:
+                file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in self._pending))
+            self._meta_lines += len(self._pending)
+            self._pending = []
+        # re-upserted ids leave stale lines behind; rewrite once they are the majority
+        if self._meta_lines > 2 * len(self._rows):
+            self._compact_meta()
+
+    def _compact_meta(self):
+        """Rewrites the sidecar with one line per live row, atomically."""
+        tmp_file = self._meta_file + ".tmp"
+        records = [
+            {"__row__": row, **record} for row, record in enumerate(self._records) if record is not None
+        ]
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        os.replace(tmp_file, self._meta_file)
+        self._meta_lines = len(records)
+
+    async def upsert(self, data: dict[str, dict]):
+        logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
+        if not len(data):
+            logger.warning("You insert an empty data to vector DB")
+            return []
+        records = [
+            {
+                "__id__": k,
+                **{k1: v1 for k1, v1 in v.items() if k1 in self.meta_fields},
+            }
+            for k, v in data.items()
+        ]
+        contents = [v["content"] for v in data.values()]
+        batches = [
+            contents[i : i + self._max_batch_size]
+            for i in range(0, len(contents), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        updated = [record["__id__"] for record in records if record["__id__"] in self._rows]
+        inserted = [record["__id__"] for record in records if record["__id__"] not in self._rows]
+        self._write(records, np.concatenate(embeddings_list))
+        return {"update": updated, "insert": inserted}
+
+    async def query(self, query: str, top_k=5):
+        n_rows = len(self._records)
+        if n_rows == 0:
+            return []
+        embedding = await self.embedding_func([query])
+        embedding = np.asarray(embedding[0], dtype=np.float32)
+        embedding = embedding / max(np.linalg.norm(embedding), 1e-12)
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, n_rows, self._block_rows):
+            block = np.asarray(self._matrix[start:min(start + self._block_rows, n_rows)], dtype=np.float32)
+            rows = np.concatenate([best_rows, np.arange(start, start + len(block))])
+            scores = np.concatenate([best_scores, block @ embedding])
+            if len(scores) > top_k:
+                keep = np.argpartition(-scores, top_k)[:top_k]
+                rows, scores = rows[keep], scores[keep]
+            best_rows, best_scores = rows, scores
+
+        results = []
+        for i in np.argsort(-best_scores, kind="stable"):
+            if best_scores[i] < self.cosine_better_than_threshold:
+                break
+            record = self._records[best_rows[i]]
+            if record is None:
+                continue
+            score = float(best_scores[i])
+            results.append({**record, "__metrics__": score, "id": record["__id__"], "distance": score})
+        return results
+
+    async def index_done_callback(self):
+        self._flush()
+
+
+@dataclass
+class TrackedNetworkXStorage(NetworkXStorage):
+    """NetworkX graph store that records which nodes and edges were upserted since `reset_changes()`."""
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.reset_changes()
+
+    def reset_changes(self):
+        self.changed_nodes = set()
+        self.changed_edges = set()
+
+    async def upsert_node(self, node_id: str, node_data: dict[str, str]):
+        self.changed_nodes.add(node_id)
+        await super().upsert_node(node_id, node_data)
+
+    async def upsert_edge(self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]):
+        self.changed_edges.add(tuple(sorted((source_node_id, target_node_id))))
+        await super().upsert_edge(source_node_id, target_node_id, edge_data)
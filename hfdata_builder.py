@@ -1,5 +1,10 @@
-
-from datasets import Dataset
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datasets import Dataset, Features, Sequence, Value, concatenate_datasets, load_from_disk
 from pathlib import Path
 
 def serialize_chat(messages):
@@ -22,18 +27,23 @@ SYSTEM_PROMPT = """You are an expert academic reviewer tasked with providing a t
 Given a paper, you should quickly provide the review results.
 """
 
-paper_dir = Path("../dataset/paper")
-recon_dir = Path("../dataset/reconstruction")
+PART_FEATURES = Features({
+    "inputs": Value("string"),
+    "outputs": Value("string"),
+    "file_id": Value("string"),
+    "file_hash": Value("string"),
+})
+
 
-data = []
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
 
-for recon_file in recon_dir.glob("*.md"):
-    file_id = recon_file.stem
-    paper_file = paper_dir / f"{file_id[:-2]}.md"
-    # print(paper_file)
-    if not paper_file.exists():
-        continue
 
+def build_record(recon_file):
     input_text = recon_file.read_text(encoding="utf-8")
     output_text = recon_file.read_text(encoding="utf-8")
 
@@ -46,29 +56,248 @@ for recon_file in recon_dir.glob("*.md"):
         {"role": "assistant", "content": output_text}
     ]
 
-    data.append({
+    return {
         "inputs": serialize_chat(input_messages),
         "outputs": serialize_chat(output_messages),
-    })
+    }
 
-dataset = Dataset.from_list(data)
-dataset.save_to_disk("paper_reconstruction_sft")
 
-repo_id = "jayeew/paper-reconstruction-sft"  # 替换为您的用户名
+def generate_records(files):
+    # from_generator 在 num_proc 个进程间切分 files 列表
+    for file in files:
+        record = build_record(Path(file["path"]))
+        record["file_id"] = file["file_id"]
+        record["file_hash"] = file["file_hash"]
+        yield record
 
-import os
-from huggingface_hub import HfApi, create_repo, login
-os.environ["HF_ENDPOINT"] = "https://huggingface.co"
-login()
-try:
-    # 如果仓库不存在，先创建
-    create_repo(repo_id, repo_type="dataset")
-except:
-    pass  # 仓库已存在
-
-# 使用 push_to_hub 方法上传
-dataset.push_to_hub(
-    repo_id,
-    token=""
-)
 
+def scan_files(paper_dir, recon_dir, num_proc):
+    recon_files = []
+    for recon_file in sorted(recon_dir.glob("*.md")):
+        file_id = recon_file.stem
+        paper_file = paper_dir / f"{file_id[:-2]}.md"
+        # print(paper_file)
+        if not paper_file.exists():
+            continue
+        recon_files.append(recon_file)
+    with ProcessPoolExecutor(max_workers=num_proc) as executor:
+        hashes = list(executor.map(file_sha256, recon_files, chunksize=64))
+    return {
+        recon_file.stem: {"path": str(recon_file), "file_hash": file_hash}
+        for recon_file, file_hash in zip(recon_files, hashes)
+    }
+
+
+def load_manifest(parts_dir):
+    manifest_path = parts_dir / "manifest.json"
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+
+def save_manifest(parts_dir, manifest):
+    manifest_path = parts_dir / "manifest.json"
+    tmp_path = parts_dir / "manifest.json.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_path)
+
+
+def build_parts(paper_dir, recon_dir, parts_dir, num_proc):
+    """
+    只处理新增或内容变化的文件, 每次运行写出一个新的 part;
+    manifest 记录每个文件当前的哈希和所在的 part。
+    """
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(parts_dir)
+    files = scan_files(paper_dir, recon_dir, num_proc)
+
+    changed = [
+        {"file_id": file_id, **file}
+        for file_id, file in files.items()
+        if manifest.get(file_id, {}).get("file_hash") != file["file_hash"]
+    ]
+    removed = [file_id for file_id in manifest if file_id not in files]
+    print(f"{len(files)} 个文件, {len(changed)} 个新增或修改, {len(removed)} 个已删除")
+
+    if changed:
+        part_hash = hashlib.sha1("".join(f["file_id"] + f["file_hash"] for f in changed).encode("utf-8"))
+        part_name = f"part-{part_hash.hexdigest()[:16]}"
+        part = Dataset.from_generator(
+            generate_records,
+            features=PART_FEATURES,
+            gen_kwargs={"files": changed},
+            num_proc=min(num_proc, len(changed)),
+        )
+        part.save_to_disk(str(parts_dir / part_name))
+        for file in changed:
+            manifest[file["file_id"]] = {"file_hash": file["file_hash"], "part": part_name}
+    for file_id in removed:
+        del manifest[file_id]
+    save_manifest(parts_dir, manifest)
+
+    # 删除不再被 manifest 引用的旧 part
+    live_parts = {entry["part"] for entry in manifest.values()}
+    for part_path in parts_dir.glob("part-*"):
+        if part_path.name not in live_parts:
+            shutil.rmtree(part_path)
+    return manifest
+
+
+def assemble(parts_dir, manifest, num_proc):
+    parts = [
+        load_from_disk(str(parts_dir / part_name))
+        for part_name in sorted({entry["part"] for entry in manifest.values()})
+    ]
+    if not parts:
+        return Dataset.from_dict({"inputs": [], "outputs": []})
+    dataset = concatenate_datasets(parts)
+    # 旧 part 中被修改或删除的文件行在这里过滤掉
+    current = {file_id: entry["file_hash"] for file_id, entry in manifest.items()}
+    dataset = dataset.filter(
+        lambda file_id, file_hash: current.get(file_id) == file_hash,
+        input_columns=["file_id", "file_hash"],
+        num_proc=num_proc,
+    )
+    return dataset.sort("file_id").remove_columns(["file_id", "file_hash"])
+
+
+TOKENIZED_FEATURES = Features({
+    "input_ids": Sequence(Value("int32")),
+    "loss_mask": Sequence(Value("int8")),
+    "prompt_length": Value("int32"),
+    "length": Value("int32"),
+})
+
+
+def tokenize_batch(batch, tokenizer, max_len):
+    """
+    与 OpenRLHF SFTDataset 一致: 对 (inputs + outputs).rstrip("\n") + " " + eos 的完整文本分词,
+    只在 outputs 部分计算 loss。
+    loss_mask 由每个 token 的字符偏移决定: 结束位置超过 inputs 长度的 token 属于 outputs
+    (边界处跨越两部分的 token 也算 outputs); prompt_length 是 loss_mask 开头为 0 的 token 数。
+    """
+    texts = []
+    for prompt, response in zip(batch["inputs"], batch["outputs"]):
+        text = (prompt + response).rstrip("\n")
+        if not text.endswith(tokenizer.eos_token):
+            text += " " + tokenizer.eos_token
+        texts.append(text)
+    encoded = tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+    tokenized = {"input_ids": [], "loss_mask": [], "prompt_length": [], "length": []}
+    for prompt, token_ids, offsets in zip(batch["inputs"], encoded["input_ids"], encoded["offset_mapping"]):
+        input_ids = token_ids[:max_len]
+        loss_mask = [int(end > len(prompt)) for _, end in offsets][:max_len]
+        tokenized["input_ids"].append(input_ids)
+        tokenized["loss_mask"].append(loss_mask)
+        tokenized["prompt_length"].append(loss_mask.index(1) if 1 in loss_mask else len(loss_mask))
+        tokenized["length"].append(len(input_ids))
+    return tokenized
+
+
+def first_fit_decreasing(lengths, capacity):
+    """
+    按长度从大到小, 把每个样本放进第一个剩余空间足够的 bin。
+    线段树维护各 bin 的最大剩余空间, 每次查找 O(log n)。
+    返回每个 bin 内的样本下标。
+    """
+    n = len(lengths)
+    size = 1
+    while size < max(n, 1):
+        size *= 2
+    tree = [capacity] * (2 * size)
+    bins = []
+    for idx in sorted(range(n), key=lambda i: lengths[i], reverse=True):
+        length = min(lengths[idx], capacity)
+        node = 1
+        while node < size:
+            node = 2 * node if tree[2 * node] >= length else 2 * node + 1
+        leaf = node - size
+        if leaf == len(bins):
+            bins.append([])
+        bins[leaf].append(idx)
+        tree[node] -= length
+        node //= 2
+        while node:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node //= 2
+    return bins
+
+
+def tokenize_dataset(dataset, tokenizer_name, max_len, num_proc):
+    from transformers import AutoTokenizer
+    # offset_mapping 需要 fast tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+    tokenized = dataset.map(
+        tokenize_batch,
+        batched=True,
+        fn_kwargs={"tokenizer": tokenizer, "max_len": max_len},
+        remove_columns=dataset.column_names,
+        features=TOKENIZED_FEATURES,
+        num_proc=num_proc,
+    )
+    lengths = tokenized["length"]
+    plan = first_fit_decreasing(lengths, max_len)
+    # 每个样本所在的 bin 也存成一列, 训练时 (pretokenized_sft.py) 经过 select / filter 后仍可按 bin 组 batch
+    pack = [0] * len(lengths)
+    for pack_id, indices in enumerate(plan):
+        for idx in indices:
+            pack[idx] = pack_id
+    tokenized = tokenized.add_column("pack", pack)
+    n_tokens = sum(lengths)
+    print(f"{len(lengths)} 个样本, {n_tokens} 个 token, 打包为 {len(plan)} 个 {max_len} token 的序列, "
+          f"填充率 {n_tokens / max(len(plan) * max_len, 1):.1%}")
+    return tokenized, plan
+
+
+def push_to_hub(dataset, repo_id, max_shard_size):
+    from huggingface_hub import HfApi, create_repo, login
+    os.environ["HF_ENDPOINT"] = "https://huggingface.co"
+    login()
+    try:
+        # 如果仓库不存在，先创建
+        create_repo(repo_id, repo_type="dataset")
+    except:
+        pass  # 仓库已存在
+
+    # 使用 push_to_hub 方法上传
+    dataset.push_to_hub(
+        repo_id,
+        max_shard_size=max_shard_size,
+        token=""
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paper_dir', type=str, default='../dataset/paper')
+    parser.add_argument('--recon_dir', type=str, default='../dataset/reconstruction')
+    parser.add_argument('--output', type=str, default='paper_reconstruction_sft')
+    parser.add_argument('--parts_dir', type=str, default='paper_reconstruction_sft_parts',
+                        help='已处理文件的 part 与 manifest 所在目录')
+    parser.add_argument('--num_proc', type=int, default=os.cpu_count())
+    parser.add_argument('--max_shard_size', type=str, default='500MB')
+    parser.add_argument('--tokenizer', type=str, default=None,
+                        help='例如 Qwen/Qwen3-0.6B; 设置后额外输出预分词的数据集和打包计划, '
+                             '用 TOKENIZED_DATASET=<tokenized_output> 运行 train_sft_*.sh 时直接训练, 不再重新分词')
+    parser.add_argument('--max_len', type=int, default=2048)
+    parser.add_argument('--tokenized_output', type=str, default='paper_reconstruction_sft_tokenized')
+    parser.add_argument('--push_to_hub', action='store_true')
+    parser.add_argument('--repo_id', type=str, default='jayeew/paper-reconstruction-sft',
+                        help='替换为您的用户名')
+    args = parser.parse_args()
+
+    parts_dir = Path(args.parts_dir)
+    manifest = build_parts(Path(args.paper_dir), Path(args.recon_dir), parts_dir, args.num_proc)
+    dataset = assemble(parts_dir, manifest, args.num_proc)
+    dataset.save_to_disk(args.output, max_shard_size=args.max_shard_size)
+
+    if args.tokenizer:
+        tokenized, plan = tokenize_dataset(dataset, args.tokenizer, args.max_len, args.num_proc)
+        tokenized.save_to_disk(args.tokenized_output, max_shard_size=args.max_shard_size)
+        with open(Path(args.tokenized_output) / "packing_plan.json", "w") as file:
+            json.dump({"max_len": args.max_len, "packs": plan}, file)
+
+    if args.push_to_hub:
+        push_to_hub(dataset, args.repo_id, args.max_shard_size)
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def make_key(*parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache for LLM responses: a bounded in-memory LRU in front of a
+    persistent GraphRAG key-value store.
+
+    Records use the `{"return": ..., "model": ...}` layout of nano-graphrag's
+    llm_response_cache, plus the generation latency so hits can report the
+    time they saved. Concurrent calls with the same key share one generation,
+    also across event loops. Safe to call from several threads and loops.
+    """
+
+    def __init__(self, store=None, max_entries=1024):
+        self.store = store
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "store_hits": 0,
+            "shared": 0,
+            "misses": 0,
+            "bytes_served": 0,
+            "bytes_generated": 0,
+            "saved_seconds": 0.0,
+            "generation_seconds": 0.0,
+        }
+
+    def _remember(self, key, record):
+        self._memory[key] = record
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _count_hit(self, kind, record):
+        self._stats[kind] += 1
+        self._stats["bytes_served"] += len(record["return"].encode("utf-8"))
+        self._stats["saved_seconds"] += record.get("latency", 0.0)
+
+    async def get_or_compute(self, key, compute, store=None, **fields):
+        """
+        Returns the cached response for `key`, or awaits `compute()` and caches
+        its result. `store` overrides the persistent store for this call;
+        `fields` are saved alongside the response.
+        """
+        store = store if store is not None else self.store
+        with self._lock:
+            record = self._memory.get(key)
+            if record is not None:
+                self._memory.move_to_end(key)
+                self._count_hit("memory_hits", record)
+                return record["return"]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            record = await asyncio.wrap_future(future)
+            with self._lock:
+                self._count_hit("shared", record)
+            return record["return"]
+
+        try:
+            record = await store.get_by_id(key) if store is not None else None
+            if record is not None:
+                with self._lock:
+                    self._count_hit("store_hits", record)
+            else:
+                start = time.perf_counter()
+                result = await compute()
+                record = {"return": result, **fields, "latency": time.perf_counter() - start}
+                if store is not None:
+                    await store.upsert({key: record})
+                with self._lock:
+                    self._stats["misses"] += 1
+                    self._stats["bytes_generated"] += len(result.encode("utf-8"))
+                    self._stats["generation_seconds"] += record["latency"]
+            with self._lock:
+                self._remember(key, record)
+            future.set_result(record)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return record["return"]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._memory))
+        hits = stats["memory_hits"] + stats["store_hits"] + stats["shared"]
+        total = hits + stats["misses"]
+        stats["hit_ratio"] = hits / total if total else 0.0
+        return stats
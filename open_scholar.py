@@ -1,38 +1,65 @@
 import argparse
+import asyncio
+import heapq
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
+import time
 import graph_rag
+import tracing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from openai import OpenAI
-from pypdf import PdfReader
-from FlagEmbedding import BGEM3FlagModel,FlagReranker
-from prompts import generation_instance_prompts_summarization
-from pdf_downloader import ACLPDFDownloader
-
-def retrieval_recall(query, reference):
-    model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
-    sentence_pairs = [(query, ref) for ref in reference]
-    similarity_scores = model.compute_score(
-        sentence_pairs,
-        max_passage_length=2048,  # a smaller max length leads to a lower latency
+from openai import OpenAI, AsyncOpenAI
+from prompt_builder import PromptBuilder
+from batch_review import run_batch
+from pdf_downloader import ConcurrentPDFDownloader, PDFCache
+from corpus_index import CorpusIndex, format_paper
+from dedup import Deduplicator
+from batching import BatchedEncoder, BatchedReranker
+from search_cache import SearchCache, SharedResults
+from pdf_text import TextStore
+from context_builder import ContextBuilder
+from graph_storage import SQLiteKVStorage
+from llm_cache import LLMCache, make_key
+
+def cascade_cutoff(candidates, scores, k, margin=None, min_keep=1):
+    # candidates are sorted by score; keep at most k and stop early once a
+    # score falls more than `margin` below the best one
+    keep = min(k, len(candidates))
+    if margin is not None and keep > 0:
+        within = sum(1 for score in scores[:keep] if score >= scores[0] - margin)
+        keep = max(within, min(min_keep, keep))
+    return candidates[:keep], scores[:keep]
+
+def retrieval_recall(query, paper_ids, corpus_index, recall_k=100, rerank_m=30,
+                     recall_margin=None, rescore_margin=None):
+    # papers are encoded once in the corpus index, only the query is encoded here
+    encoded_query = corpus_index.encode_query(query)
+    # stage 1: cheap dense-only pass over every candidate
+    dense_ids, dense_scores = corpus_index.search(
+        query,
+        paper_ids,
+        weights_for_different_modes=[1, 0, 0],
+        encoded_query=encoded_query,
+        top_k=recall_k
+    )
+    dense_ids, _ = cascade_cutoff(dense_ids, dense_scores, recall_k, recall_margin)
+    # stage 2: colbert+sparse+dense rescoring of the top-K
+    sorted_ids, sorted_scores = corpus_index.search(
+        query,
+        dense_ids,
         weights_for_different_modes=[0.4, 0.2, 0.4],
-        batch_size=100
-    )['colbert+sparse+dense']
-    paired = list(zip(reference, similarity_scores))
-    paired_sorted = sorted(paired, key=lambda x: x[1], reverse=True)
-    sorted_references = [p for p, s in paired_sorted]
-    sorted_scores = [s for p, s in paired_sorted]
-    # print(sorted_scores)
-    return sorted_references, sorted_scores
+        encoded_query=encoded_query,
+        top_k=rerank_m
+    )
+    return cascade_cutoff(sorted_ids, sorted_scores, rerank_m, rescore_margin)
     
-def retrieval_rerank(query, reference):
-    model = FlagReranker("OpenSciLM/OpenScholar_Reranker", use_fp16=True)
+def retrieval_rerank(query, reference, model):
     sentence_pairs = [(query, ref) for ref in reference]
-    rerank_scores = model.compute_score(
-        sentence_pairs,
-        batch_size=100
-    )
+    rerank_scores = model.compute_score(sentence_pairs)
     paired = list(zip(reference, rerank_scores))
     paired_sorted = sorted(paired, key=lambda x: x[1], reverse=True)
     sorted_references = [p for p, s in paired_sorted]
@@ -40,159 +67,419 @@ def retrieval_rerank(query, reference):
 
     return sorted_references, sorted_scores
 
-def extract_text_with_pypdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
-
 class Reviewer:
     def __init__(self, args):
         self.args = args
         self.client_large = None
+        self.async_client_large = None
         self.open_scholar = None
-        self.pdf_downloader = ACLPDFDownloader(max_retries=2, retry_delay=3.0)
+        self.embedder = None
+        self.reranker = None
+        self.corpus_index = None
+        self.context_builder = None
+        self.prompt_builder = None
         self.save_path = "./downloads"
         Path(self.save_path).mkdir(exist_ok=True)
+        self.pdf_downloader = ConcurrentPDFDownloader(
+            max_workers=args.download_workers,
+            host_rate=args.download_host_rate,
+            max_retries=2,
+            retry_delay=3.0,
+            cache=PDFCache(os.path.join(self.save_path, "manifest.json"), max_age=args.pdf_cache_max_age)
+        )
+
+        self.text_store = TextStore(args.text_cache_dir, max_workers=args.extract_workers)
+        self.tracer = tracing.configure(enabled=args.trace, sink=args.trace_file, memory=args.trace_memory)
 
         self.initialize_models()
+        self.tracer.gauge("cache_hit_ratio", lambda: self.llm_cache.stats()["hit_ratio"], cache="llm")
+        self.tracer.gauge("llm_cache_saved_seconds", lambda: self.llm_cache.stats()["saved_seconds"])
 
     def initialize_models(self,):
         self.client_large = OpenAI(
-            api_key="",
+            api_key="EMPTY",
+            base_url=f'http://localhost:{self.args.large_model_port}/v1',
+        )
+        # generation runs on one background event loop shared by all requests,
+        # so a single async client and concurrency limit cover every caller
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="generation-loop", daemon=True).start()
+        self.async_client_large = AsyncOpenAI(
+            api_key="EMPTY",
             base_url=f'http://localhost:{self.args.large_model_port}/v1',
         )
+        self._generation_slots = asyncio.run_coroutine_threadsafe(
+            self._make_semaphore(self.args.generation_concurrency), self._loop
+        ).result()
+        os.makedirs(self.args.llm_cache_dir, exist_ok=True)
+        self.llm_cache = LLMCache(
+            SQLiteKVStorage(namespace="llm_response_cache", global_config={"working_dir": self.args.llm_cache_dir}),
+            max_entries=self.args.llm_cache_entries
+        )
         self.open_scholar = OpenScholar(
             args=self.args
         )
+        # concurrent requests share forward passes through the micro-batchers
+        self.embedder = BatchedEncoder(
+            self.load_encoder(),
+            max_batch_size=self.args.max_batch_size,
+            max_wait=self.args.batch_wait_ms / 1000
+        )
+        self.corpus_index = CorpusIndex(
+            self.embedder,
+            index_dir=self.args.index_dir,
+            max_passage_length=2048,  # a smaller max length leads to a lower latency
+            batch_size=self.args.max_batch_size,
+            quantization=self.args.index_quantization,
+            oversample=self.args.rescore_oversample
+        )
+        self.reranker = BatchedReranker(
+            self.load_reranker(),
+            max_batch_size=self.args.max_batch_size,
+            max_wait=self.args.batch_wait_ms / 1000
+        )
+        tokenizer = self.load_tokenizer()
+        self.context_builder = ContextBuilder(
+            self.embedder,
+            tokenizer,
+            max_tokens=self.args.context_tokens
+        )
+        # with --send_token_ids the static few-shot prefix is tokenized once and shared by every request
+        self.prompt_builder = PromptBuilder(tokenizer if self.args.send_token_ids else None)
+
+    # model loaders are separate so benchmarks can substitute small or fake models;
+    # the model libraries are only imported when a real model is loaded
+    def load_encoder(self):
+        from FlagEmbedding import BGEM3FlagModel
+        return BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
+
+    def load_reranker(self):
+        from FlagEmbedding import FlagReranker
+        return FlagReranker(self.args.reranker_path, use_fp16=True)
+
+    def load_tokenizer(self):
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(self.args.large_model)
 
     def __call__(self, key_words, input):
-        if os.path.exists("papers.json"):
-            with open("papers.json", "r") as file:
-                papers = [json.loads(line.strip()) for line in file if line.strip()]
-        else:
-            papers = self.open_scholar.search_semantic_scholar(key_words)
-            with open("papers.json", "w") as file:
-                for paper in papers:
-                    print(json.dumps(paper), file=file)
+        # tokens are printed as they arrive
+        review = self.review(key_words, input, on_token=lambda token: print(token, end="", flush=True))["review"]
+        print()
+        return review
+
+    def review(self, key_words, input, on_token=None):
+        timings = {}
+        with self.tracer.span("review") as review_span:
+            result = self._review(key_words, input, on_token, timings)
+        timings["total"] = review_span.duration
+        return result
+
+    def _review(self, key_words, input, on_token, timings):
+        papers, page = [], []
+        search = self.open_scholar.iter_semantic_scholar(key_words)
+        # preprint / published copies of a work are merged before they are encoded
+        deduplicator = Deduplicator(threshold=self.args.dedup_threshold) if self.args.dedup_threshold else None
+        with self.tracer.span("search", timings) as span:
+            while True:
+                paper = next(search, None)
+                if paper is not None and deduplicator is not None:
+                    paper, is_new = deduplicator.add(paper)
+                    if not is_new:
+                        span.add("duplicates")
+                        continue
+                if paper is not None:
+                    papers.append(paper)
+                    page.append(paper)
+                # papers are indexed page by page while the search is still streaming
+                if page and (paper is None or len(page) >= self.args.search_batch_size):
+                    with self.tracer.span("index", timings) as index_span:
+                        # only papers that are not indexed yet get encoded
+                        index_span.add("papers", len(page))
+                        index_span.add("encoded", self.corpus_index.add(page))
+                    page = []
+                if paper is None:
+                    break
+            span.add("papers", len(papers))
+        # index spans run inside the search span; timings keep the two apart
+        timings["search"] -= timings.get("index", 0.0)
         
         paper2Id, Id2paper = {}, {}
-        paper_formatted = []
         for idx, paper in enumerate(papers):
-            item = f'Title:{paper["title"]}. Abstract:{paper["abstract"]}'
-            paper_formatted.append(item)
+            item = format_paper(paper)
             paper2Id[item] = paper["paperId"]
             Id2paper[paper["paperId"]] = paper
-
-        paper_recalled, _ = retrieval_recall(input, paper_formatted)
-        paper_recalled = paper_recalled[:round(len(paper_recalled)/10)]
-        paper_reranked, _ = retrieval_rerank(input, paper_recalled)
-        paper_reranked = paper_reranked[:round(len(paper_reranked)/10)]
+        with self.tracer.span("recall", timings) as span:
+            recalled_ids, _ = retrieval_recall(
+                input,
+                list(Id2paper),
+                self.corpus_index,
+                recall_k=self.args.recall_k,
+                rerank_m=self.args.rerank_m,
+                recall_margin=self.args.recall_margin,
+                rescore_margin=self.args.rescore_margin
+            )
+            paper_recalled = [format_paper(Id2paper[paper_id]) for paper_id in recalled_ids]
+            span.add("candidates", len(Id2paper))
+            span.add("recalled", len(paper_recalled))
+        with self.tracer.span("rerank", timings) as span:
+            # stage 3: cross-encoder reranking of the top-M, cut to --top_n
+            paper_reranked, rerank_scores = retrieval_rerank(input, paper_recalled, self.reranker)
+            paper_reranked, _ = cascade_cutoff(paper_reranked, rerank_scores, self.args.top_n, self.args.rerank_margin)
+            span.add("pairs", len(paper_recalled))
+            span.add("kept", len(paper_reranked))
 
         paper_after_retrieval = [Id2paper[paper2Id[item]] for item in paper_reranked] 
-        # success_id, failed_id = self._paper_download(paper_after_retrieval)
-        success_id = ['5bea7828c7a5aeaac8fc86e2012d8fa43ba64242', 'ec1c43ca684732d06716a36271a4cb3066797153', '0b9d0bee85e4ef4261147f35be885010e62ad1fb']
-        reference_rag, reference_scholar = "", ""
-        for idx, item in enumerate(paper_after_retrieval):
-            if item["paperId"] in success_id:
-                reference_rag += extract_text_with_pypdf(os.path.join(self.save_path, f'{item["paperId"]}.pdf'))
-            else:
-                reference_rag += f'Title:{item["title"]}. Abstract:{item["abstract"]}\n'
-            reference_scholar += f'[{idx}]. Title:{item["title"]}. Abstract:{item["abstract"]}\n'
+        with self.tracer.span("download", timings) as span:
+            # cached PDFs are reused without network traffic
+            success_id, failed_id = self._paper_download(paper_after_retrieval)
+            span.add("downloaded", len(success_id))
+            span.add("failed", len(failed_id))
+        with self.tracer.span("extraction", timings) as span:
+            pdf_texts = self.text_store.extract_many(
+                [os.path.join(self.save_path, f'{paper_id}.pdf') for paper_id in success_id],
+                max_pages=self.args.max_pdf_pages
+            )
+            full_texts = {
+                paper_id: pdf_texts[os.path.join(self.save_path, f'{paper_id}.pdf')]
+                for paper_id in success_id
+            }
+            span.add("chars", sum(len(text) for text in full_texts.values()))
+        with self.tracer.span("context", timings) as span:
+            # best full-text chunks packed into --context_tokens, keeping [n] numbering
+            reference_context, n_cited = self.context_builder.build(input, paper_after_retrieval, full_texts)
+            paper_after_retrieval = paper_after_retrieval[:n_cited]
+            span.add("references", n_cited)
         
+        # reference_rag = "".join(
+        #     full_texts.get(item["paperId"], f'Title:{item["title"]}. Abstract:{item["abstract"]}\n')
+        #     for item in paper_after_retrieval
+        # )
         # graph_rag.insert(reference_rag)
         # response = graph_rag.query(
         #     query=f'What are the novel contributions of {input} compared to the foundational work?',
         #     mode='global'
         # )
         
-        review = self._generate_review(reference_scholar, input, "")
-        print(review)
-        # return review
+        with self.tracer.span("generation", timings) as span:
+            generation = self._generate_review(reference_context, input, "", on_token=on_token)
+            # streamed chunks carry one token each on vLLM-style servers
+            span.add("tokens", generation["tokens"])
+            span.add("cache_hits" if generation["cached"] else "cache_misses")
+            span.set("ttft", generation["ttft"])
+        review = generation["content"]
+        timings["ttft"] = generation["ttft"]
+
+        return {
+            "review": review,
+            "references": [item["paperId"] for item in paper_after_retrieval],
+            "timings": timings
+        }
 
     def _paper_download(self, paper_after_retrieval):
         success_id = []
-        for paper in paper_after_retrieval:
-            if paper["isOpenAccess"]:
-                try:
-                    url = paper["url"]
-                    filename = f'{paper["paperId"]}.pdf'
-                    saved_file = self.pdf_downloader.download_acl_pdf(
-                        url,
-                        save_dir=self.save_path,
-                        filename=filename
-                    )
-                    if saved_file and os.path.exists(saved_file):
-                        file_size = os.path.getsize(saved_file)
-                        print(f"✓ 下载成功: {saved_file} ({file_size:,} bytes)")
-                        success_id.append(paper["paperId"])
-                    else:
-                        print("✗ 下载失败")
-                except Exception as e:
-                    print(f"✗ 下载失败: {e}")
-                    continue
+        tasks = [
+            (paper["paperId"], paper["url"], f'{paper["paperId"]}.pdf')
+            for paper in paper_after_retrieval
+            if paper["isOpenAccess"] and paper["url"]
+        ]
+        # results stream back as each download finishes
+        for paper_id, saved_file, error in self.pdf_downloader.download_many(tasks, save_dir=self.save_path):
+            if saved_file and os.path.exists(saved_file):
+                file_size = os.path.getsize(saved_file)
+                print(f"✓ 下载成功: {saved_file} ({file_size:,} bytes)")
+                success_id.append(paper_id)
+            else:
+                print(f"✗ 下载失败: {error}")
         failed_id = [paper["paperId"] for paper in paper_after_retrieval if paper["paperId"] not in success_id]
         return success_id, failed_id
 
-    def _generate_review(self, reference, abstract, innovation):
-        # rank papers
-        
-        input_query = generation_instance_prompts_summarization.format_map({
-            "reference":reference, 
-            "abstract":abstract,
-            "innovation":innovation
-        })
-        input_query = self._formate_llama3_prompt(input_query)
-
-        with open("temp.json", "w") as file:
-            print(json.dumps(input_query), file=file)
-
-        # response = self.client_large.chat.completions.create(
-        #     model=self.args.large_model,
-        #     messages=[{"role":"user", "content":input_query}],
-        #     temperature=0.7,
-        #     max_tokens=self.args.max_tokens,
-        #     stream=False,
-        #     timeout=300
-        # )
-        # content = response.choices[0].message['content']
+    def _build_prompt(self, reference, abstract, innovation):
+        if self.args.send_token_ids:
+            return self.prompt_builder.build_ids(reference, abstract, innovation)
+        return self.prompt_builder.build_text(reference, abstract, innovation)
+
+    def _generate_review(self, reference, abstract, innovation, on_token=None):
+        input_query = self._build_prompt(reference, abstract, innovation)
+
+        if self.args.dump_prompt:
+            with open(self.args.dump_prompt, "w") as file:
+                print(json.dumps(input_query), file=file)
+
+        return asyncio.run_coroutine_threadsafe(
+            self._agenerate_review(input_query, on_token), self._loop
+        ).result()
+
+    @staticmethod
+    async def _make_semaphore(value):
+        return asyncio.Semaphore(value)
+
+    async def _agenerate_review(self, input_query, on_token=None):
+        start = time.perf_counter()
+        ttft, streamed, n_chunks = None, False, 0
+
+        async def generate():
+            nonlocal ttft, streamed, n_chunks
+            streamed = True
+            pieces = []
+            async with self._generation_slots:
+                # the prompt already carries the Llama-3 chat template, token ids or text,
+                # so it goes to the completions endpoint rather than being templated again
+                stream = await self.async_client_large.completions.create(
+                    model=self.args.large_model,
+                    prompt=input_query,
+                    temperature=0.7,
+                    max_tokens=self.args.max_tokens,
+                    stream=True,
+                    timeout=300,
+                    # the text starts with <|begin_of_text|> itself
+                    extra_body=None if isinstance(input_query, list) else {"add_special_tokens": False}
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].text
+                    if not delta:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    pieces.append(delta)
+                    n_chunks += 1
+                    if on_token is not None:
+                        on_token(delta)
+            return "".join(pieces)
 
-        # return content
+        # token ids and text of the same prompt are cached separately
+        key = make_key(self.args.large_model, input_query, self.args.max_tokens)
+        content = await self.llm_cache.get_or_compute(key, generate, model=self.args.large_model)
+        if not streamed:
+            # served from the cache or shared with an identical request in flight
+            ttft = time.perf_counter() - start
+            if on_token is not None and content:
+                on_token(content)
 
-    def _formate_llama3_prompt(self, prompt):
-        formatted_text = "<|begin_of_text|>"
-        formatted_text += "<|start_header_id|>user<|end_header_id|>\n\n" + prompt + "<|eot_id|>"
-        formatted_text += "<|start_header_id|>assistant<|end_header_id|>\n\n"
-        return formatted_text
+        return {
+            "content": content,
+            "ttft": ttft,
+            "generation_time": time.perf_counter() - start,
+            "tokens": n_chunks,
+            "cached": not streamed
+        }
 
 class OpenScholar:
     def __init__(self, args):
         self.s2_api_key = args.s2_api_key
         self.and_search = args.and_search
-        self.url = "http://api.semanticscholar.org/graph/v1/paper/search/bulk"
+        # batch jobs share keywords, so or-searches are split per keyword there;
+        # a single review keeps one capped query
+        self.split_keywords = args.jobs is not None
+        self.url = args.s2_url
+        self.fields = "paperId,title,year,authors.name,abstract,venue,citationCount,url,externalIds,isOpenAccess,openAccessPdf"
+        self.year = "2023-"
+        self.sort = "citationCount:desc"
+        self.max_results = args.max_search_results
+        self.max_retries = 5
+        self.backoff = 1.0
+        self.search_cache = SearchCache(
+            args.search_cache,
+            ttl=args.search_cache_ttl,
+            max_entries=args.search_cache_size
+        )
+        # searches are fetched in the background and shared with every request
+        # for the same query while they are in flight
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._fetcher = ThreadPoolExecutor(max_workers=args.search_workers, thread_name_prefix="s2-search")
+        # one pooled session keeps connections alive across pages and requests
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=16))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=16))
+        self.session.headers.update({"x-api-key": self.s2_api_key})
 
     def __call__(self,):
         pass
 
     def search_semantic_scholar(self, key_words):
-        papers = self._search_paper_via_query(key_words)
-        print(f"Retrieved {len(papers)} papers...")
+        return list(self.iter_semantic_scholar(key_words))
+
+    def iter_semantic_scholar(self, key_words):
+        """
+        Yields formatted papers as result pages arrive; complete result lists are cached.
+
+        In batch mode an or-search is run per keyword, so jobs that share a
+        keyword share its search. Each keyword's results arrive sorted by
+        citation count and are merged lazily, giving the same papers as the
+        combined query at up to one capped fetch per keyword; outside batch
+        mode that extra fetching would not be reused, so one query is sent.
+        """
+        # duplicate keywords would only repeat a search
+        key_words = list({" ".join(kw.lower().split()): kw for kw in key_words}.values())
+        if self.and_search or not self.split_keywords or len(key_words) < 2:
+            yield from self._iter_search(key_words)
+            return
+        merged = heapq.merge(
+            *[self._iter_search([kw]) for kw in key_words],
+            key=lambda paper: -(paper["citationCount"] or 0)
+        )
+        seen = set()
+        for paper in merged:
+            if paper["paperId"] in seen:
+                continue
+            seen.add(paper["paperId"])
+            yield paper
+            if self.max_results is not None and len(seen) >= self.max_results:
+                return
+
+    def _iter_search(self, key_words):
+        query_key = SearchCache.make_key(
+            key_words,
+            and_search=self.and_search,
+            year=self.year,
+            sort=self.sort,
+            fields=self.fields,
+            max_results=self.max_results
+        )
+        formatted_papers = self.search_cache.get(query_key)
+        if formatted_papers is not None:
+            tracing.add("cache_hits")
+            print(f"Loaded {len(formatted_papers)} cached papers...")
+            yield from formatted_papers
+            return
+
+        with self._in_flight_lock:
+            results = self._in_flight.get(query_key)
+            # searches shared with a request in flight count as hits
+            tracing.add("cache_misses" if results is None else "cache_hits")
+            if results is None:
+                results = self._in_flight[query_key] = SharedResults()
+                self._fetcher.submit(self._fetch, key_words, query_key, results)
+        yield from results
+
+    def _fetch(self, key_words, query_key, results):
         formatted_papers = []
-        for paper in papers:
-            formatted_papers.append({
-                "paperId":paper["paperId"],
-                "year":paper["year"],
-                "title":paper["title"],
-                "authors": (', ').join([author["name"] for author in paper["authors"]]),
-                "venue":paper["venue"],
-                "citationCount":paper["citationCount"],
-                "abstract":paper["abstract"],
-                "isOpenAccess":paper["isOpenAccess"],
-                "url":paper["openAccessPdf"]["url"]
-            })
-
-        return formatted_papers
+        try:
+            for paper in self._search_paper_via_query(key_words):
+                formatted_paper = {
+                    "paperId":paper["paperId"],
+                    "year":paper["year"],
+                    "title":paper["title"],
+                    "authors": (', ').join([author["name"] for author in paper["authors"]]),
+                    "venue":paper["venue"],
+                    "citationCount":paper["citationCount"],
+                    "abstract":paper["abstract"],
+                    "isOpenAccess":paper["isOpenAccess"],
+                    "url":(paper.get("openAccessPdf") or {}).get("url")
+                }
+                formatted_papers.append(formatted_paper)
+                results.append(formatted_paper)
+            print(f"Retrieved {len(formatted_papers)} papers...")
+            self.search_cache.put(query_key, formatted_papers)
+        except Exception as e:
+            results.finish(e)
+        else:
+            results.finish()
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[query_key]
 
     def _search_paper_via_query(self, query):
         if self.and_search:
@@ -201,25 +488,121 @@ class OpenScholar:
             query = ' | '.join([f'"{kw}"' for kw in query])
         query_params = {
             'query': query,
-            'fields': "paperId,title,year,authors.name,abstract,venue,citationCount,url,externalIds,isOpenAccess,openAccessPdf",
-            "year": "2023-",
-            "sort": "citationCount:desc"
+            'fields': self.fields,
+            "year": self.year,
+            "sort": self.sort
         }
-        headers = {"x-api-key":self.s2_api_key}
-        response = requests.get(
-            self.url,
-            params=query_params,
-            headers=headers
-        )
-        if response.status_code == 200:
-            response_data = response.json()["data"]
+        n_results = 0
+        while True:
+            response_data = self._get_page(query_params)
+            for paper in response_data.get("data") or []:
+                yield paper
+                n_results += 1
+                if self.max_results is not None and n_results >= self.max_results:
+                    return
+            # bulk search returns a continuation token until the last page
+            token = response_data.get("token")
+            if not token:
+                return
+            query_params["token"] = token
+
+    def _get_page(self, query_params):
+        for attempt in range(self.max_retries + 1):
+            response = self.session.get(self.url, params=query_params, timeout=60)
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            if attempt == self.max_retries:
+                break
+            retry_after = response.headers.get("Retry-After")
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = self.backoff * 2 ** attempt
+            print(f"Semantic Scholar returned {response.status_code}, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+        response.raise_for_status()
+        return response.json()
+
+class ReviewRequestHandler(BaseHTTPRequestHandler):
+    reviewer = None
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            body = self.reviewer.tracer.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
         else:
-            raise response.status_code
+            self._send_json(404, {"error": f"unknown path {self.path}"})
 
-        return response_data
+    def do_POST(self):
+        if self.path != "/review":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            key_words, abstract = request["key_words"], request["abstract"]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+        if request.get("stream"):
+            self._stream_review(key_words, abstract)
+            return
+        try:
+            result = self.reviewer.review(key_words, abstract)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, result)
 
-if __name__ == '__main__':
+    def _stream_review(self, key_words, abstract):
+        # newline-delimited JSON: one {"token": ...} line per chunk, then the full result
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        def write_line(payload):
+            self.wfile.write((json.dumps(payload) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            result = self.reviewer.review(key_words, abstract, on_token=lambda token: write_line({"token": token}))
+        except Exception as e:
+            write_line({"error": str(e)})
+            return
+        write_line(result)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve(reviewer, port, host="127.0.0.1"):
+    # models are loaded once by the reviewer and shared by every request thread
+    handler = type("Handler", (ReviewRequestHandler,), {"reviewer": reviewer})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Review server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def build_parser():
     parser = argparse.ArgumentParser(description='OpenScholar API Server')
+    parser.add_argument('--s2_url', type=str, default='http://api.semanticscholar.org/graph/v1/paper/search/bulk',
+                        help='Semantic Scholar bulk search endpoint')
+    parser.add_argument('--max_search_results', type=int, default=1000,
+                        help='Max papers read from the paginated bulk search')
     parser.add_argument('--s2_api_key', type=str, default='RdC229ErL37in7bNEmR7W5MFVrd3pzpv1SWWbrLt',
                         help='Semantic Scholar API key')
     parser.add_argument('--large_model', type=str, default='OpenSciLM/Llama-3.1_OpenScholar-8B',
@@ -232,19 +615,95 @@ if __name__ == '__main__':
                         help='Port for small model server')
     parser.add_argument('--api_port', type=int, default=38015,
                         help='Port for API server')
-    parser.add_argument('--and_search', type=bool, default='False',
-                        help='and / or search')
+    parser.add_argument('--serve', action='store_true',
+                        help='Keep models resident and serve review requests on --api_port')
+    parser.add_argument('--and_search', action='store_true',
+                        help='Search papers matching all keywords instead of any of them')
+    parser.add_argument('--search_workers', type=int, default=4,
+                        help='Semantic Scholar searches fetched concurrently')
+    parser.add_argument('--search_cache', type=str, default='./cache/search_cache.sqlite',
+                        help='SQLite file caching Semantic Scholar search results')
+    parser.add_argument('--search_cache_ttl', type=float, default=7 * 24 * 3600,
+                        help='Seconds before a cached search result expires')
+    parser.add_argument('--search_cache_size', type=int, default=1000,
+                        help='Max cached searches before least recently used ones are evicted')
     parser.add_argument('--reranker_path', type=str, default='OpenSciLM/OpenScholar_Reranker',
                         help='Path to reranker model')
+    parser.add_argument('--index_dir', type=str, default='./corpus_index',
+                        help='Directory of the persistent corpus embedding index')
+    parser.add_argument('--index_quantization', type=str, choices=['int8', 'binary'], default=None,
+                        help='Rank with memory-mapped dense / colbert codes and rescore the best candidates with the '
+                             'float vectors (rescoring keeps the final ranking). Codes are paged in instead of float '
+                             'vectors only for passes that rank many more papers than they keep (int8 about 4x smaller, '
+                             'binary about 30x); the default colbert pass rescores all its candidates in float, '
+                             'see benchmarks/quantization.py')
+    parser.add_argument('--rescore_oversample', type=int, default=None,
+                        help='With --index_quantization, candidates rescored in float per paper kept '
+                             '(defaults to 4 for int8, 10 for binary)')
+    parser.add_argument('--max_batch_size', type=int, default=100,
+                        help='Max (query, passage) pairs per embedder / reranker forward pass')
+    parser.add_argument('--batch_wait_ms', type=float, default=5.0,
+                        help='How long a batch waits for concurrent requests before running')
+    parser.add_argument('--dedup_threshold', type=float, default=0.8,
+                        help='Merge search results whose title+abstract shingles are this similar (0 disables)')
+    parser.add_argument('--recall_k', type=int, default=100,
+                        help='Papers kept by the dense-only pass for colbert+sparse+dense rescoring')
+    parser.add_argument('--rerank_m', type=int, default=30,
+                        help='Papers kept by the rescoring pass for the cross-encoder reranker')
+    parser.add_argument('--recall_margin', type=float, default=None,
+                        help='Stop the dense pass at papers scoring this far below the best one')
+    parser.add_argument('--rescore_margin', type=float, default=None,
+                        help='Stop the rescoring pass at papers scoring this far below the best one')
+    parser.add_argument('--rerank_margin', type=float, default=None,
+                        help='Stop the reranking pass at papers scoring this far below the best one')
+    parser.add_argument('--download_workers', type=int, default=8,
+                        help='Max PDF downloads in flight')
+    parser.add_argument('--download_host_rate', type=float, default=1.0,
+                        help='Requests per second allowed to each PDF host')
+    parser.add_argument('--pdf_cache_max_age', type=float, default=30 * 24 * 3600,
+                        help='Seconds a downloaded PDF is used before it is revalidated')
+    parser.add_argument('--text_cache_dir', type=str, default='./text_cache',
+                        help='Directory of the extracted PDF text store')
+    parser.add_argument('--extract_workers', type=int, default=None,
+                        help='Processes used to parse PDFs (defaults to the CPU count)')
+    parser.add_argument('--max_pdf_pages', type=int, default=None,
+                        help='Only extract the first N pages of each PDF')
+    parser.add_argument('--context_tokens', type=int, default=6000,
+                        help='Token budget of the reference context, measured with the --large_model tokenizer')
     parser.add_argument('--top_n', type=int, default=10,
                         help='Top N papers to retrieve')
     parser.add_argument('--max_tokens', type=int, default=3000,
                         help='Maximum tokens for generation')
+    parser.add_argument('--send_token_ids', action='store_true',
+                        help='Send pre-tokenized prompts to the completions endpoint')
+    parser.add_argument('--dump_prompt', type=str, default=None,
+                        help='Debug: write each review prompt to this file, e.g. temp.json for test.py')
+    parser.add_argument('--generation_concurrency', type=int, default=16,
+                        help='Max concurrent streaming requests to the large model server')
+    parser.add_argument('--llm_cache_dir', type=str, default='./cache',
+                        help='Directory of the persistent LLM response cache')
+    parser.add_argument('--llm_cache_entries', type=int, default=1024,
+                        help='Responses kept in the in-memory LLM cache')
+    parser.add_argument('--trace', action='store_true',
+                        help='Record per-stage spans and counters, exported on /metrics in --serve mode')
+    parser.add_argument('--trace_file', type=str, default=None,
+                        help='JSONL file finished spans are appended to (implies --trace)')
+    parser.add_argument('--trace_memory', action='store_true',
+                        help='Add resident-memory snapshots to every span')
+    parser.add_argument('--jobs', type=str, default=None,
+                        help='JSONL file of {"key_words": [...], "abstract": ...} review jobs')
+    parser.add_argument('--output', type=str, default='reviews.jsonl',
+                        help='JSONL file batch results are appended to')
+    parser.add_argument('--batch_workers', type=int, default=4,
+                        help='Jobs reviewed concurrently in batch mode')
     parser.add_argument('--search_batch_size', type=int, default=100,
                         help='Batch size for search generation')
     parser.add_argument('--scholar_batch_size', type=int, default=100,
                         help='Batch size for OpenScholar processing')
-    args = parser.parse_args()
+    return parser
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
 
     # key_words = ["Human noroviruses", "GII.4", "Nanobody M4", "Neutralization", "Epochal evolution","Raised conformation"]
     key_words = ["generative ai"]
@@ -252,4 +711,9 @@ if __name__ == '__main__':
     query = "Generative artificial intelligence (AI) has revolutionized AI by enabling high-fidelity content creation across text, images, audio, and structured data. This survey explores the core methodologies, advancements, applications, and ongoing challenges of generative AI, covering key models such as Variational Autoencoders (VAEs), Generative Adversarial Networks (GANs), Diffusion Models, and Transformer-based architectures. These innovations have driven breakthroughs in healthcare, scientific computing, Natural Language Processing (NLP), computer vision, and autonomous systems. Despite its progress, generative AI faces challenges in bias mitigation, interpretability, computational efficiency, and ethical governance, necessitating research into scalable architectures, explainability, and AI safety mechanisms. Integrating Reinforcement Learning (RL), multi-modal learning, and self-supervised techniques enhances controllability and adaptability in generative models. Additionally, as AI reshapes industrial automation, digital media, and scientific discovery, its societal and economic implications demand robust policy frameworks. This survey provides a comprehensive analysis of generative AI’s current state and future directions, highlighting innovations in efficient generative modelling, AI-driven scientific reasoning, adversarial robustness, and ethical deployment. By consolidating theoretical insights and real-world applications, it offers a structured foundation for researchers, industry professionals, and policymakers to navigate the evolving landscape of generative AI."
 
     server = Reviewer(args)
-    server(key_words, query)
\ No newline at end of file
+    if args.serve:
+        serve(server, args.api_port)
+    elif args.jobs:
+        run_batch(server, args.jobs, args.output, workers=args.batch_workers)
+    else:
+        server(key_words, query)
\ No newline at end of file
@@ -1,29 +1,177 @@
 import os
 import time
 import re
+import json
+import shutil
+import hashlib
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse, urljoin
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
 import random
 
+
+class TokenBucket:
+    """
+    令牌桶限速器，线程安全
+
+    参数:
+        rate: 每秒补充的令牌数
+        capacity: 桶容量（允许的突发请求数）
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class HostRateLimiter:
+    """按主机名分别限速，每个主机一个令牌桶"""
+
+    def __init__(self, rate: float = 1.0, capacity: float = 2.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url: str):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.capacity)
+            bucket = self.buckets[host]
+        bucket.acquire()
+
+class PDFCache:
+    """
+    PDF下载缓存清单
+
+    按文件名（paperId）记录下载来源URL、解析出的PDF地址、ETag/Last-Modified、
+    文件大小和SHA-256，清单以JSON原子写入磁盘。
+    
+    参数:
+        manifest_path: 清单文件路径
+        max_age: 缓存文件在多少秒内直接使用，超过后用条件请求重新验证
+    """
+
+    def __init__(self, manifest_path: str, max_age: float = 30 * 24 * 3600):
+        self.manifest_path = manifest_path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as file:
+                self.entries = json.load(file)
+
+    def lookup(self, filename: str, url: str, save_path: str) -> Optional[Dict[str, Any]]:
+        """返回与URL和磁盘文件都一致的缓存记录"""
+        with self.lock:
+            entry = self.entries.get(filename)
+        if entry is None or entry["url"] != url:
+            return None
+        if not os.path.exists(save_path) or os.path.getsize(save_path) != entry["size"]:
+            return None
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["checked_at"] < self.max_age
+
+    def copy_by_url(self, url: str, filename: str, save_path: str) -> bool:
+        """同一URL已被其他文件名缓存时，直接复用该文件"""
+        with self.lock:
+            matches = [(name, dict(entry)) for name, entry in self.entries.items() if entry["url"] == url and name != filename]
+        for name, entry in matches:
+            source = os.path.join(os.path.dirname(save_path), name)
+            if not os.path.exists(source) or os.path.getsize(source) != entry["size"]:
+                continue
+            tmp_path = save_path + '.tmp'
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, save_path)
+            with self.lock:
+                self.entries[filename] = entry
+                self._save()
+            return True
+        return False
+
+    def record(self, filename: str, url: str, pdf_url: str, save_path: str, headers):
+        sha256 = hashlib.sha256()
+        with open(save_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                sha256.update(block)
+        with self.lock:
+            self.entries[filename] = {
+                "url": url,
+                "pdf_url": pdf_url,
+                "etag": headers.get('ETag'),
+                "last_modified": headers.get('Last-Modified'),
+                "size": os.path.getsize(save_path),
+                "sha256": sha256.hexdigest(),
+                "checked_at": time.time(),
+            }
+            self._save()
+
+    def touch(self, filename: str):
+        """条件请求返回304后刷新验证时间"""
+        with self.lock:
+            self.entries[filename]["checked_at"] = time.time()
+            self._save()
+
+    def _save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.entries, file)
+        os.replace(tmp_path, self.manifest_path)
+
+
 class ACLPDFDownloader:
     """
     专门针对ACL Anthology网站的PDF下载器
     采用先访问HTML页面再下载PDF的策略绕过反爬机制
     """
     
-    def __init__(self, max_retries: int = 3, retry_delay: float = 2.0):
+    def __init__(self, max_retries: int = 3, retry_delay: float = 2.0,
+                 rate_limiter: Optional[HostRateLimiter] = None, pool_size: int = 10,
+                 cache: Optional["PDFCache"] = None):
         """
         初始化下载器
         
         参数:
             max_retries: 最大重试次数
             retry_delay: 重试延迟（秒）
+            rate_limiter: 按主机限速器，设置后用令牌桶代替下载前的随机等待
+            pool_size: 每个主机的连接池大小
+            cache: 下载缓存，为None时每次都重新下载
         """
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        # 同一文件同一时间只允许一个线程下载，避免共用.part文件
+        self._file_locks: Dict[str, threading.Lock] = {}
+        self._file_locks_lock = threading.Lock()
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self._setup_session()
     
     def _setup_session(self):
@@ -50,22 +198,28 @@ class ACLPDFDownloader:
             'Sec-Fetch-User': '?1',
         })
     
-    def _extract_pdf_url_from_html(self, html_url: str) -> Optional[str]:
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """发送GET请求，设置了限速器时先获取该主机的令牌"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        return self.session.get(url, **kwargs)
+    
+    def _extract_pdf_url_from_html(self, html_url: str, html_content: Optional[str] = None) -> Optional[str]:
         """
         从HTML页面提取PDF下载链接
         
         参数:
             html_url: HTML页面URL
+            html_content: 已获取的页面内容，为None时重新请求html_url
             
         返回:
             PDF下载URL，如果提取失败则返回None
         """
         try:
-            response = self.session.get(html_url, timeout=10)
-            response.raise_for_status()
-            
-            # 在HTML中查找PDF链接
-            html_content = response.text
+            if html_content is None:
+                response = self._get(html_url, timeout=10)
+                response.raise_for_status()
+                html_content = response.text
             
             # 方法1: 查找a标签中的PDF链接
             pdf_patterns = [
@@ -95,11 +249,20 @@ class ACLPDFDownloader:
             print(f"从HTML提取PDF链接失败: {e}")
             return None
     
+    def _file_lock(self, save_path: str) -> threading.Lock:
+        with self._file_locks_lock:
+            return self._file_locks.setdefault(os.path.abspath(save_path), threading.Lock())
+    
     def download_acl_pdf(self, pdf_url: str, save_dir: str = ".", 
                         filename: Optional[str] = None) -> str:
         """
         下载ACL Anthology的PDF文件
         
+        设置了缓存时，已下载且未过期的文件直接返回；过期的文件用ETag/Last-Modified
+        做条件请求，未修改时不重新下载；中断的下载从.part文件断点续传，
+        并用If-Range带上开始下载时的ETag/Last-Modified，文件已变化时服务器返回完整文件。
+        同一文件的并发调用按文件加锁依次执行，后到的调用通常直接命中缓存。
+        
         参数:
             pdf_url: PDF文件的URL地址
             save_dir: 保存目录，默认为当前目录
@@ -119,10 +282,24 @@ class ACLPDFDownloader:
                 filename = "acl_paper.pdf"
         
         save_path = os.path.join(save_dir, filename)
-        
+        with self._file_lock(save_path):
+            return self._download_acl_pdf(pdf_url, filename, save_path)
+    
+    def _download_acl_pdf(self, pdf_url: str, filename: str, save_path: str) -> str:
         print(f"目标PDF URL: {pdf_url}")
         print(f"保存到: {save_path}")
         
+        # 0. 检查缓存
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.lookup(filename, pdf_url, save_path)
+            if entry is not None and self.cache.is_fresh(entry):
+                print(f"使用缓存文件: {save_path}")
+                return save_path
+            if entry is None and self.cache.copy_by_url(pdf_url, filename, save_path):
+                print(f"使用相同URL的缓存文件: {save_path}")
+                return save_path
+        
         # 1. 构造HTML页面URL
         # ACL Anthology的URL格式: https://aclanthology.org/2020.acl-main.447.pdf
         # 对应的HTML页面: https://aclanthology.org/2020.acl-main.447/
@@ -130,41 +307,46 @@ class ACLPDFDownloader:
         if not html_url.endswith('/'):
             html_url += '/'
         
-        print(f"1. 访问HTML页面: {html_url}")
-        
         for attempt in range(self.max_retries):
             try:
                 if attempt > 0:
                     print(f"第 {attempt} 次重试...")
                     time.sleep(self.retry_delay * attempt)
                 
-                # 2. 先访问HTML页面，建立会话
-                html_headers = self.session.headers.copy()
-                html_headers.update({
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Referer': 'https://aclanthology.org/',
-                })
-                
-                html_response = self.session.get(
-                    html_url,
-                    headers=html_headers,
-                    timeout=15,
-                    allow_redirects=True
-                )
-                html_response.raise_for_status()
-                
-                print(f"HTML页面访问成功 (状态码: {html_response.status_code})")
-                
-                # 3. 从HTML页面提取PDF链接（如果需要）
-                extracted_pdf_url = self._extract_pdf_url_from_html(html_url)
-                if extracted_pdf_url and extracted_pdf_url != pdf_url:
-                    print(f"从HTML页面提取到新的PDF URL: {extracted_pdf_url}")
-                    pdf_url = extracted_pdf_url
-                
-                # 4. 等待随机时间，模拟用户行为
-                wait_time = random.uniform(1.0, 3.0)
-                print(f"等待 {wait_time:.1f} 秒后下载PDF...")
-                time.sleep(wait_time)
+                if entry is not None:
+                    # 已有缓存时直接对解析过的PDF地址做条件请求，不再访问HTML页面
+                    download_url = entry["pdf_url"]
+                else:
+                    # 2. 先访问HTML页面，建立会话
+                    print(f"1. 访问HTML页面: {html_url}")
+                    html_headers = self.session.headers.copy()
+                    html_headers.update({
+                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                        'Referer': 'https://aclanthology.org/',
+                    })
+                    
+                    html_response = self._get(
+                        html_url,
+                        headers=html_headers,
+                        timeout=15,
+                        allow_redirects=True
+                    )
+                    html_response.raise_for_status()
+                    
+                    print(f"HTML页面访问成功 (状态码: {html_response.status_code})")
+                    
+                    # 3. 从同一次获取的HTML页面中提取PDF链接（如果需要）
+                    download_url = pdf_url
+                    extracted_pdf_url = self._extract_pdf_url_from_html(html_url, html_response.text)
+                    if extracted_pdf_url and extracted_pdf_url != pdf_url:
+                        print(f"从HTML页面提取到新的PDF URL: {extracted_pdf_url}")
+                        download_url = extracted_pdf_url
+                    
+                    # 4. 等待随机时间，模拟用户行为（有限速器时由令牌桶控制请求间隔）
+                    if self.rate_limiter is None:
+                        wait_time = random.uniform(1.0, 3.0)
+                        print(f"等待 {wait_time:.1f} 秒后下载PDF...")
+                        time.sleep(wait_time)
                 
                 # 5. 下载PDF文件
                 pdf_headers = self.session.headers.copy()
@@ -174,58 +356,71 @@ class ACLPDFDownloader:
                     'Referer': html_url,  # 重要：设置Referer为HTML页面
                     'Upgrade-Insecure-Requests': '0',
                 })
+                if entry is not None:
+                    if entry.get("etag"):
+                        pdf_headers['If-None-Match'] = entry["etag"]
+                    if entry.get("last_modified"):
+                        pdf_headers['If-Modified-Since'] = entry["last_modified"]
                 
-                print(f"2. 下载PDF文件: {pdf_url}")
-                response = self.session.get(
-                    pdf_url,
+                part_path = save_path + '.part'
+                validator = self._part_validator(part_path, download_url)
+                resume_from = os.path.getsize(part_path) if validator else 0
+                if resume_from > 0:
+                    pdf_headers['Range'] = f'bytes={resume_from}-'
+                    pdf_headers['If-Range'] = validator
+                    print(f"从 {resume_from} bytes 处继续下载")
+                
+                print(f"2. 下载PDF文件: {download_url}")
+                response = self._get(
+                    download_url,
                     headers=pdf_headers,
                     stream=True,
                     timeout=30
                 )
                 
                 # 检查响应状态
-                if response.status_code == 200:
+                if response.status_code == 304 and entry is not None:
+                    print("文件未修改，使用缓存")
+                    self.cache.touch(filename)
+                    return save_path
+                elif response.status_code in (200, 206):
                     print(f"PDF请求成功 (状态码: {response.status_code})")
                     
-                    # 获取文件大小
-                    total_size = int(response.headers.get('content-length', 0))
-                    
                     # 检查Content-Type
                     content_type = response.headers.get('Content-Type', '').lower()
                     if 'pdf' not in content_type and 'application/octet-stream' not in content_type:
                         print(f"警告: Content-Type不是PDF: {content_type}")
                         # 但仍然继续下载，有些服务器可能返回错误的Content-Type
                     
-                    # 下载文件
-                    with open(save_path, 'wb') as file:
-                        if total_size == 0:
-                            file.write(response.content)
-                            print("下载完成（无进度信息）")
-                        else:
-                            downloaded_size = 0
-                            chunk_size = 8192
-                            
-                            for chunk in response.iter_content(chunk_size=chunk_size):
-                                if chunk:
-                                    file.write(chunk)
-                                    downloaded_size += len(chunk)
-                                    
-                                    progress = (downloaded_size / total_size) * 100
-                                    print(f"\r下载进度: {progress:.1f}% ({downloaded_size}/{total_size} bytes)", end="")
-                            
-                            print("\n下载完成")
+                    if response.status_code == 206 and not response.headers.get('Content-Range', '').startswith(f'bytes {resume_from}-'):
+                        # 返回的范围与.part文件不衔接，丢弃后重新下载
+                        print("返回的范围不匹配，重新下载")
+                        self._remove_part(part_path)
+                        continue
+                    if response.status_code == 200:
+                        # 记录这次下载的校验值，中断后续传时用于If-Range
+                        self._save_part_validator(part_path, download_url, response.headers)
+                    
+                    # 下载到.part文件，完成后原子替换目标文件
+                    self._write_response(response, part_path, append=response.status_code == 206)
+                    os.replace(part_path, save_path)
+                    self._remove_part(part_path)
                     
                     # 验证文件
-                    if os.path.exists(save_path):
-                        file_size = os.path.getsize(save_path)
-                        if file_size > 0:
-                            print(f"文件已成功保存，大小: {file_size:,} bytes")
-                            return save_path
-                        else:
-                            raise Exception("下载的文件大小为0")
+                    file_size = os.path.getsize(save_path)
+                    if file_size > 0:
+                        print(f"文件已成功保存，大小: {file_size:,} bytes")
+                        if self.cache is not None:
+                            self.cache.record(filename, pdf_url, download_url, save_path, response.headers)
+                        return save_path
                     else:
-                        raise Exception("文件保存失败")
+                        raise Exception("下载的文件大小为0")
                         
+                elif response.status_code == 416:
+                    # .part文件已不匹配服务器上的文件，丢弃后重新下载
+                    print("416范围请求无效，重新下载")
+                    self._remove_part(part_path)
+                    continue
                 elif response.status_code == 403:
                     print("403禁止访问，可能需要更新User-Agent或等待更长时间")
                     continue
@@ -254,6 +449,48 @@ class ACLPDFDownloader:
         
         raise Exception(f"下载失败，已达到最大重试次数 {self.max_retries}")
     
+    def _part_validator(self, part_path: str, download_url: str) -> Optional[str]:
+        """返回.part文件开始下载时的ETag或Last-Modified，没有记录或URL不同时返回None（不续传）"""
+        if not os.path.exists(part_path):
+            return None
+        try:
+            with open(part_path + '.json', 'r') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != download_url:
+            return None
+        return meta.get("etag") or meta.get("last_modified")
+    
+    def _save_part_validator(self, part_path: str, download_url: str, headers):
+        with open(part_path + '.json', 'w') as file:
+            json.dump({
+                "url": download_url,
+                "etag": headers.get('ETag'),
+                "last_modified": headers.get('Last-Modified'),
+            }, file)
+    
+    def _remove_part(self, part_path: str):
+        for path in (part_path, part_path + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def _write_response(self, response: requests.Response, path: str, append: bool = False):
+        """把响应内容写入文件，append为True时追加（断点续传）"""
+        total_size = int(response.headers.get('content-length', 0))
+        downloaded_size = 0
+        next_report = 0.1
+        with open(path, 'ab' if append else 'wb') as file:
+            for chunk in response.iter_content(chunk_size=65536):
+                if chunk:
+                    file.write(chunk)
+                    downloaded_size += len(chunk)
+                    # 每10%输出一次进度
+                    if total_size and downloaded_size / total_size >= next_report:
+                        print(f"下载进度: {downloaded_size / total_size * 100:.0f}% ({downloaded_size}/{total_size} bytes)")
+                        next_report += 0.1
+        print("下载完成")
+    
     def download_pdf_direct(self, pdf_url: str, save_path: str) -> bool:
         """
         直接下载PDF（备用方法）
@@ -294,6 +531,69 @@ class ACLPDFDownloader:
         """关闭会话"""
         self.session.close()
 
+
+class ConcurrentPDFDownloader:
+    """
+    并发PDF下载器
+
+    多个线程共享一个ACLPDFDownloader（同一个连接池），按主机用令牌桶限速，
+    同时进行的下载数不超过max_workers，每个下载完成后立即返回结果。
+    同一文件名的任务只下载一次，其他任务共享同一个future的结果。
+    """
+
+    def __init__(self, max_workers: int = 8, host_rate: float = 1.0, host_burst: float = 2.0,
+                 max_retries: int = 2, retry_delay: float = 3.0, cache: Optional[PDFCache] = None):
+        """
+        参数:
+            max_workers: 同时进行的最大下载数
+            host_rate: 每个主机每秒允许的请求数
+            host_burst: 每个主机允许的突发请求数
+            max_retries: 单个文件的最大重试次数
+            retry_delay: 重试延迟（秒）
+            cache: 下载缓存
+        """
+        self.max_workers = max_workers
+        self.downloader = ACLPDFDownloader(
+            max_retries=max_retries,
+            retry_delay=retry_delay,
+            rate_limiter=HostRateLimiter(host_rate, host_burst),
+            pool_size=max_workers,
+            cache=cache
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf-download")
+
+    def download_many(self, tasks: Iterable[Tuple[str, str, str]], save_dir: str = ".") -> Iterator[Tuple[str, Optional[str], Optional[Exception]]]:
+        """
+        并发下载多个PDF，按完成顺序逐个返回结果
+
+        参数:
+            tasks: (key, pdf_url, filename) 列表
+            save_dir: 保存目录
+
+        返回:
+            (key, 保存的文件路径, None) 或 (key, None, 异常) 的迭代器
+        """
+        in_flight: Dict[Tuple[str, Optional[str]], Any] = {}
+        keys: Dict[Any, list] = {}
+        for key, url, filename in tasks:
+            future = in_flight.get((url, filename))
+            if future is None:
+                future = in_flight[(url, filename)] = self.executor.submit(
+                    self.downloader.download_acl_pdf, url, save_dir, filename
+                )
+            keys.setdefault(future, []).append(key)
+        for future in as_completed(keys):
+            for key in keys[future]:
+                try:
+                    yield key, future.result(), None
+                except Exception as e:
+                    yield key, None, e
+
+    def close(self):
+        """关闭线程池和会话"""
+        self.executor.shutdown(wait=True)
+        self.downloader.close()
+
 def test_acl_download():
     """测试ACL PDF下载"""
     print("=" * 60)
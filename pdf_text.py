@@ -0,0 +1,161 @@
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pypdf import PdfReader
+
+import tracing
+
+
+def extract_pages(pdf_path, max_pages=None):
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page in reader.pages:
+        if max_pages is not None and len(pages) >= max_pages:
+            break
+        pages.append((page.extract_text() or "") + "\n")
+    return pages, len(reader.pages)
+
+
+def extract_text_with_pypdf(pdf_path, max_pages=None):
+    pages, _ = extract_pages(pdf_path, max_pages)
+    return "".join(pages)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class TextStore:
+    """
+    On-disk store of extracted PDF text keyed by the SHA-256 of the PDF.
+
+    Page texts are appended to a single `texts.bin` file and located through
+    an append-only `index.jsonl`; hits are read back through mmap. Misses are
+    parsed with pypdf in a process pool.
+    """
+
+    def __init__(self, store_dir="./text_cache", max_workers=None):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.data_path = self.store_dir / "texts.bin"
+        self.index_path = self.store_dir / "index.jsonl"
+        self.data_path.touch()
+        self.max_workers = max_workers or os.cpu_count()
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._mmap = None
+        self._mmap_size = 0
+        self._load()
+
+    def _load(self):
+        if not self.index_path.exists():
+            return
+        data_size = self.data_path.stat().st_size
+        with open(self.index_path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn write from an interrupted run
+                    continue
+                if entry["page_offsets"][-1] <= data_size:
+                    self.entries[entry["sha256"]] = entry
+
+    def _view(self, end):
+        # the map is reopened only when it does not cover newly appended text
+        if self._mmap is None or self._mmap_size < end:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap_size = self.data_path.stat().st_size
+            with open(self.data_path, "rb") as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+
+    def get(self, sha256, max_pages=None):
+        """Cached text of the first `max_pages` pages, or None if they were never extracted."""
+        with self._lock:
+            entry = self.entries.get(sha256)
+            if entry is None:
+                return None
+            n_pages = len(entry["page_offsets"]) - 1
+            if max_pages is None or max_pages > n_pages:
+                if n_pages < entry["total_pages"]:
+                    return None
+                max_pages = n_pages
+            start, end = entry["page_offsets"][0], entry["page_offsets"][max_pages]
+            if start == end:
+                return ""
+            view = self._view(end)
+            try:
+                return str(view[start:end], "utf-8")
+            finally:
+                view.release()
+
+    def put(self, sha256, pages, total_pages):
+        encoded = [page.encode("utf-8") for page in pages]
+        with self._lock:
+            with open(self.data_path, "ab") as file:
+                offset = file.tell()
+                file.write(b"".join(encoded))
+            page_offsets = [offset]
+            for page in encoded:
+                page_offsets.append(page_offsets[-1] + len(page))
+            entry = {"sha256": sha256, "page_offsets": page_offsets, "total_pages": total_pages}
+            with open(self.index_path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+            self.entries[sha256] = entry
+
+    def extract_many(self, pdf_paths, max_pages=None):
+        """Returns {pdf_path: text}; PDFs without cached text are parsed in parallel."""
+        texts, missing = {}, {}
+        for pdf_path in pdf_paths:
+            sha256 = file_sha256(pdf_path)
+            text = self.get(sha256, max_pages)
+            if text is None:
+                missing[pdf_path] = sha256
+            else:
+                texts[pdf_path] = text
+        tracing.add("cache_hits", len(texts))
+        tracing.add("cache_misses", len(missing))
+        if not missing:
+            return texts
+
+        with self._lock:
+            # concurrent callers must not each start a pool
+            if self._executor is None:
+                # spawn keeps workers independent of model threads in the parent
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            executor = self._executor
+        futures = {
+            pdf_path: executor.submit(extract_pages, pdf_path, max_pages)
+            for pdf_path in missing
+        }
+        for pdf_path, future in futures.items():
+            pages, total_pages = future.result()
+            self.put(missing[pdf_path], pages, total_pages)
+            texts[pdf_path] = "".join(pages)
+        return texts
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
@@ -0,0 +1,85 @@
+"""
+用 hfdata_builder.py --tokenizer 输出的预分词数据集训练 OpenRLHF SFT, 启动时不再重新分词。
+
+    deepspeed --module pretokenized_sft --dataset paper_reconstruction_sft_tokenized ...
+
+参数与 openrlhf.cli.train_sft 相同, 只是 --dataset 指向 --tokenized_output 目录,
+--max_len 应与生成数据时相同。设置 --packing_samples 时按打包计划组 batch:
+每个训练单元是计划中的一个 bin, --micro_train_batch_size / --train_batch_size 按 bin 计数,
+一个 micro batch 的 bin 在训练时拼成一条序列 (micro batch 为 1 时不超过 --max_len)。
+"""
+import runpy
+
+import torch
+from torch.utils.data import Dataset
+
+import openrlhf.datasets
+from openrlhf.utils.utils import zero_pad_sequences
+
+
+class PretokenizedSFTDataset(Dataset):
+    """
+    替代 openrlhf.datasets.SFTDataset, 接口相同。
+    直接读取 input_ids / loss_mask / prompt_length / pack 列, 返回与 SFTDataset 相同格式的张量;
+    与 SFTDataset 一样过滤掉 prompt 长度 >= max_length - 2 的样本。
+    """
+
+    def __init__(self, dataset, tokenizer, max_length, strategy, input_template=None, pretrain_mode=False,
+                 num_processors=8, multiturn=False):
+        super().__init__()
+        if multiturn:
+            raise ValueError("预分词数据集不支持 --multiturn")
+        self.dataset = dataset
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.pretrain_mode = pretrain_mode
+
+        prompt_lengths = dataset["prompt_length"]
+        keep = [i for i, n in enumerate(prompt_lengths) if pretrain_mode or n < max_length - 2]
+        if getattr(strategy.args, "packing_samples", False):
+            packs = {}
+            pack_ids = dataset["pack"]
+            for i in keep:
+                packs.setdefault(pack_ids[i], []).append(i)
+            self.items = list(packs.values())
+        else:
+            self.items = [[i] for i in keep]
+        strategy.print(f"{len(dataset)} 个预分词样本, 保留 {len(keep)} 个, 共 {len(self.items)} 个训练单元")
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        return [self._sample(i) for i in self.items[idx]]
+
+    def _sample(self, i):
+        row = self.dataset[i]
+        if self.pretrain_mode:
+            # 与 SFTDataset 的 pretrain_mode 相同: 只训练 inputs, 全部 token 计算 loss
+            input_ids = row["input_ids"][:min(row["prompt_length"], self.max_length)]
+            return self._tensors(input_ids, [1] * len(input_ids))
+
+        input_ids = row["input_ids"][:self.max_length]
+        mask = row["loss_mask"][:self.max_length]
+        # 与 SFTDataset 一样最后一个 token 总是 eos (被截断时替换)
+        input_ids[-1] = self.tokenizer.eos_token_id
+        mask[-1] = 1
+        # SFTDataset 的 loss_mask 第 i 位对应预测第 i + 1 个 token
+        return self._tensors(input_ids, mask[1:] + [0])
+
+    def _tensors(self, input_ids, loss_mask):
+        input_ids = torch.tensor([input_ids], dtype=torch.long)
+        return input_ids, torch.ones_like(input_ids), torch.tensor([loss_mask], dtype=torch.float32)
+
+    def collate_fn(self, item_list):
+        samples = [sample for item in item_list for sample in item]
+        input_ids = zero_pad_sequences([s[0] for s in samples], "right", self.tokenizer.pad_token_id)
+        attention_masks = zero_pad_sequences([s[1] for s in samples], "right")
+        loss_masks = zero_pad_sequences([s[2] for s in samples], "right")
+        return input_ids, attention_masks, loss_masks
+
+
+if __name__ == "__main__":
+    # train_sft 在运行时从 openrlhf.datasets 导入 SFTDataset, 替换后其余流程不变
+    openrlhf.datasets.SFTDataset = PretokenizedSFTDataset
+    runpy.run_module("openrlhf.cli.train_sft", run_name="__main__", alter_sys=True)
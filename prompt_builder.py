@@ -0,0 +1,47 @@
+from prompts import generation_demonstration_summarization, generation_instance_suffix_summarization
+
+LLAMA3_USER_HEADER = "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n"
+LLAMA3_ASSISTANT_HEADER = "<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
+
+
+class PromptBuilder:
+    """
+    Builds Llama-3 review prompts as a static prefix plus a per-request suffix.
+
+    The prefix (chat header and few-shot demonstration) is the same string for
+    every request, so the inference server's prefix cache always hits on it.
+    With a tokenizer, its token ids are computed once and only the variable
+    suffix is tokenized per request.
+    """
+
+    def __init__(self, tokenizer=None,
+                 prefix=LLAMA3_USER_HEADER + generation_demonstration_summarization,
+                 suffix_template=generation_instance_suffix_summarization + LLAMA3_ASSISTANT_HEADER):
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.suffix_template = suffix_template
+        self.prefix_ids = None
+        if tokenizer is not None:
+            self.prefix_ids = self._encode(prefix)
+            # splitting at the prefix boundary must give the same ids as tokenizing the whole prompt
+            sample = self.prefix + self._suffix("[0]. Title:x. Abstract:y\n", "z", "")
+            if self._encode(sample)[:len(self.prefix_ids)] != self.prefix_ids:
+                raise ValueError("prompt prefix does not end on a token boundary")
+
+    def _encode(self, text):
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def _suffix(self, reference, abstract, innovation):
+        return self.suffix_template.format_map({
+            "reference": reference,
+            "abstract": abstract,
+            "innovation": innovation
+        })
+
+    def build_text(self, reference, abstract, innovation):
+        return self.prefix + self._suffix(reference, abstract, innovation)
+
+    def build_ids(self, reference, abstract, innovation):
+        if self.prefix_ids is None:
+            raise ValueError("build_ids needs a tokenizer")
+        return self.prefix_ids + self._encode(self._suffix(reference, abstract, innovation))
@@ -26,4 +26,5 @@ promts_w_references_summarization = ("Given an abstract of an academic paper, th
                        "\nInnovation: {example_innovation}"
                        "\n[Response_Start]{example_answer}[Response_End]\nNow, please generate another related work given the following abstract.\n##\n")
 generation_demonstration_summarization = promts_w_references_summarization.format_map({"example_passages": example_passages_summarization, "example_innovation":"", "example_question": example_question_summarization, "example_answer": example_answer_summarization})
-generation_instance_prompts_summarization = generation_demonstration_summarization + "References:\n {reference}\n Abstract: {abstract}\n Innovation: {innovation}\n"
\ No newline at end of file
+generation_instance_suffix_summarization = "References:\n {reference}\n Abstract: {abstract}\n Innovation: {innovation}\n"
+generation_instance_prompts_summarization = generation_demonstration_summarization + generation_instance_suffix_summarization
\ No newline at end of file
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class SearchCache:
+    """
+    SQLite cache of Semantic Scholar search results.
+
+    A query is keyed by its normalized keywords and search options. Paper
+    records are stored once and shared by every query that returned them.
+    Entries expire after `ttl` seconds and the least recently used queries are
+    evicted once more than `max_entries` are stored.
+    """
+
+    def __init__(self, path="./cache/search_cache.sqlite", ttl=7 * 24 * 3600, max_entries=1000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS queries (
+                    query_key TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS query_papers (
+                    query_key TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    paper_id TEXT NOT NULL,
+                    PRIMARY KEY (query_key, position)
+                );
+                CREATE INDEX IF NOT EXISTS query_papers_paper ON query_papers (paper_id);
+                CREATE TABLE IF NOT EXISTS papers (
+                    paper_id TEXT PRIMARY KEY,
+                    record TEXT NOT NULL
+                );
+            """)
+
+    @staticmethod
+    def make_key(key_words, **options):
+        key_words = sorted({" ".join(kw.lower().split()) for kw in key_words})
+        payload = json.dumps({"key_words": key_words, **options}, sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, query_key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at FROM queries WHERE query_key = ?", (query_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl:
+                with self._conn:
+                    self._delete_queries([query_key])
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE queries SET accessed_at = ? WHERE query_key = ?", (now, query_key)
+                )
+            rows = self._conn.execute(
+                "SELECT p.record FROM query_papers q JOIN papers p ON q.paper_id = p.paper_id "
+                "WHERE q.query_key = ? ORDER BY q.position",
+                (query_key,)
+            ).fetchall()
+        return [json.loads(record) for record, in rows]
+
+    def put(self, query_key, papers):
+        now = time.time()
+        with self._lock, self._conn:
+            self._delete_queries([query_key])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO papers (paper_id, record) VALUES (?, ?)",
+                [(paper["paperId"], json.dumps(paper)) for paper in papers]
+            )
+            self._conn.executemany(
+                "INSERT INTO query_papers (query_key, position, paper_id) VALUES (?, ?, ?)",
+                [(query_key, position, paper["paperId"]) for position, paper in enumerate(papers)]
+            )
+            self._conn.execute(
+                "INSERT INTO queries (query_key, created_at, accessed_at) VALUES (?, ?, ?)",
+                (query_key, now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        expired = [key for key, in self._conn.execute(
+            "SELECT query_key FROM queries WHERE created_at < ?", (now - self.ttl,)
+        )]
+        overflow = [key for key, in self._conn.execute(
+            "SELECT query_key FROM queries WHERE created_at >= ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?",
+            (now - self.ttl, self.max_entries)
+        )]
+        self._delete_queries(expired + overflow)
+
+    def _delete_queries(self, query_keys):
+        if not query_keys:
+            return
+        self._conn.executemany("DELETE FROM queries WHERE query_key = ?", [(key,) for key in query_keys])
+        self._conn.executemany("DELETE FROM query_papers WHERE query_key = ?", [(key,) for key in query_keys])
+        # paper records are shared, drop only the ones no query refers to anymore
+        self._conn.execute(
+            "DELETE FROM papers WHERE paper_id NOT IN (SELECT paper_id FROM query_papers)"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SharedResults:
+    """
+    Results of one search as they arrive. Any number of consumers iterate
+    them concurrently while the producer is still appending, so a request
+    that finds the same search in flight streams it instead of fetching it
+    again.
+    """
+
+    def __init__(self):
+        self._items = []
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def append(self, item):
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: position < len(self._items) or self._done)
+                items = self._items[position:]
+                done, error = self._done, self._error
+            yield from items
+            position += len(items)
+            if done and position == len(self._items):
+                if error is not None:
+                    raise error
+                return
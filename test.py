@@ -1,23 +1,38 @@
+import asyncio
+import json
+import time
+from openai import AsyncOpenAI
 
-from openai import OpenAI
-
-if __name__ == '__main__':
-    client_large = OpenAI(
+async def main():
+    client_large = AsyncOpenAI(
             api_key="",
             base_url=f'http://localhost:{38011}/v1',
     )
 
+    # written by open_scholar.py --dump_prompt temp.json: the templated prompt text, or its token ids
     with open("temp.json", "r") as file:
-        input_query = file.read()
+        input_query = json.loads(file.read())
     # print(input_query)
-    response = client_large.chat.completions.create(
+    start = time.perf_counter()
+    ttft = None
+    stream = await client_large.completions.create(
         model='OpenSciLM/Llama-3.1_OpenScholar-8B',
-        messages=[{"role":"user", "content":input_query}],
+        prompt=input_query,
         temperature=0.7,
         max_tokens=3000,
-        stream=False,
-        timeout=300
+        stream=True,
+        timeout=300,
+        # the prompt already carries the chat template and <|begin_of_text|>
+        extra_body=None if isinstance(input_query, list) else {"add_special_tokens": False}
     )
-    content = response.choices[0].message.content
-    print(content)
+    async for chunk in stream:
+        if not chunk.choices or not chunk.choices[0].text:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        print(chunk.choices[0].text, end="", flush=True)
+    print()
+    print(f"time to first token: {ttft}s, total: {time.perf_counter() - start:.2f}s")
 
+if __name__ == '__main__':
+    asyncio.run(main())
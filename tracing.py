@@ -0,0 +1,266 @@
+"""
+Lightweight tracing for the review pipeline.
+
+    with tracer.span("rerank", timings) as span:
+        ...
+        span.add("pairs", len(pairs))
+
+Spans nest through a context variable, so code called inside a span can
+count into it with `tracing.add(...)` without being handed the span.
+Finished spans are written to a JSON lines sink and aggregated into
+per-stage latency histograms and counters for a Prometheus text endpoint.
+Counters named `cache_hits` / `cache_misses` also yield a per-stage hit
+ratio. When tracing is disabled a span only reads the clock twice, for
+callers that still want its duration.
+"""
+import contextvars
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def rss_bytes():
+    """Current resident set size; the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "rb") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_span():
+    return _current_span.get()
+
+
+def add(counter, value=1):
+    """Adds to a counter of the innermost enclosing span, if tracing is on."""
+    span = _current_span.get()
+    if span is not None:
+        span.add(counter, value)
+
+
+class Timer:
+    """What a disabled tracer hands out: the span interface, timing only."""
+
+    __slots__ = ("name", "timings", "start", "duration")
+
+    def __init__(self, name, timings=None):
+        self.name = name
+        self.timings = timings
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if self.timings is not None:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + self.duration
+        return False
+
+    def add(self, counter, value=1):
+        pass
+
+    def set(self, key, value):
+        pass
+
+
+class Span(Timer):
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "wall_start",
+                 "attributes", "counters", "rss_start", "_token")
+
+    def __init__(self, tracer, name, timings=None, attributes=None):
+        super().__init__(name, timings)
+        self.tracer = tracer
+        self.attributes = attributes or {}
+        self.counters = {}
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.rss_start = rss_bytes() if self.tracer.memory else None
+        self._token = _current_span.set(self)
+        self.wall_start = time.time()
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+    def add(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.wall_start,
+            "duration": self.duration,
+        }
+        if self.attributes:
+            record["attributes"] = self.attributes
+        if self.counters:
+            record["counters"] = self.counters
+        return record
+
+
+class Tracer:
+    """
+    Collects finished spans. `sink` is a JSON lines file spans are appended
+    to, `memory` adds resident-memory snapshots to every span and `prefix`
+    names the exported Prometheus metrics. Safe to share between threads.
+    """
+
+    def __init__(self, enabled=False, sink=None, memory=False, prefix="review"):
+        self._lock = threading.Lock()
+        self._sink = None
+        self.configure(enabled, sink, memory, prefix)
+
+    def configure(self, enabled=False, sink=None, memory=False, prefix="review"):
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+            self.enabled = bool(enabled or sink)
+            self.memory = memory
+            self.prefix = prefix
+            self._sink = open(sink, "a", buffering=1) if sink else None
+            self._histograms = {}
+            self._counters = {}
+            self._gauges = {}
+        return self
+
+    def span(self, name, timings=None, **attributes):
+        """
+        Context manager timing one stage. `timings`, if given, accumulates
+        the duration under `name` whether or not tracing is enabled.
+        """
+        if not self.enabled:
+            return Timer(name, timings)
+        return Span(self, name, timings, attributes)
+
+    def gauge(self, name, fn, **labels):
+        """Registers `fn()` to be exported as a gauge on every scrape."""
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = fn
+
+    def _finish(self, span):
+        record = span.to_dict()
+        if span.rss_start is not None:
+            rss = rss_bytes()
+            record["rss_mb"] = rss / 2 ** 20
+            record["rss_delta_mb"] = (rss - span.rss_start) / 2 ** 20
+        line = json.dumps(record, default=str) + "\n" if self._sink is not None else None
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = [[0] * len(BUCKETS), 0, 0.0]
+            for i, bound in enumerate(BUCKETS):
+                if span.duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += span.duration
+            for counter, value in span.counters.items():
+                key = (span.name, counter)
+                self._counters[key] = self._counters.get(key, 0) + value
+            if line is not None:
+                self._sink.write(line)
+
+    def snapshot(self):
+        """Aggregated span statistics: {stage: {"count", "seconds", counters...}}."""
+        with self._lock:
+            stages = {
+                name: {"count": count, "seconds": total}
+                for name, (_, count, total) in self._histograms.items()
+            }
+            for (name, counter), value in self._counters.items():
+                stages.setdefault(name, {})[counter] = value
+        for stats in stages.values():
+            if "cache_hits" in stats or "cache_misses" in stats:
+                lookups = stats.get("cache_hits", 0) + stats.get("cache_misses", 0)
+                stats["cache_hit_ratio"] = stats.get("cache_hits", 0) / lookups if lookups else 0.0
+        return stages
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        prefix = self.prefix
+        lines = []
+        with self._lock:
+            histograms = {name: (list(buckets), count, total) for name, (buckets, count, total) in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines.append(f"# HELP {prefix}_stage_seconds Time spent in each traced stage.")
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        for name, (buckets, count, total) in sorted(histograms.items()):
+            stage = _label(name)
+            for bound, n in zip(BUCKETS, buckets):
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {n}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        lines.append(f"# HELP {prefix}_stage_items_total Items and tokens counted by each traced stage.")
+        lines.append(f"# TYPE {prefix}_stage_items_total counter")
+        for (name, counter), value in sorted(counters.items()):
+            lines.append(f'{prefix}_stage_items_total{{stage="{_label(name)}",item="{_label(counter)}"}} {value}')
+
+        samples = {}
+        for name in sorted({name for name, _ in counters}):
+            hits = counters.get((name, "cache_hits"), 0)
+            lookups = hits + counters.get((name, "cache_misses"), 0)
+            if lookups:
+                samples.setdefault("cache_hit_ratio", []).append((f'cache="{_label(name)}"', hits / lookups))
+        for (name, labels), fn in sorted(gauges.items()):
+            try:
+                value = float(fn())
+            except Exception:
+                # a failing gauge must not break the scrape
+                continue
+            samples.setdefault(name, []).append((",".join(f'{key}="{_label(label)}"' for key, label in labels), value))
+        for name, values in samples.items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for labels, value in values:
+                lines.append(f"{prefix}_{name}{{{labels}}} {value}" if labels else f"{prefix}_{name} {value}")
+
+        lines.append("# TYPE process_resident_memory_bytes gauge")
+        lines.append(f"process_resident_memory_bytes {rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# process-wide tracer, disabled until configured
+tracer = Tracer()
+
+
+def configure(enabled=False, sink=None, memory=False, prefix="review"):
+    return tracer.configure(enabled, sink, memory, prefix)
@@ -1,10 +1,19 @@
 set fileformat=unix
 set -x
 
+# 设置 TOKENIZED_DATASET (hfdata_builder.py --tokenizer 的输出目录) 时直接用预分词数据训练, 不再重新分词
+if [[ -n "${TOKENIZED_DATASET}" ]]; then
+    MODULE=pretokenized_sft
+    DATASET=${TOKENIZED_DATASET}
+else
+    MODULE=openrlhf.cli.train_sft
+    DATASET=WestlakeNLP/DeepReview-13K
+fi
+
 read -r -d '' training_commands <<EOF
-openrlhf.cli.train_sft \
+${MODULE} \
     --max_len 2048 \
-    --dataset WestlakeNLP/DeepReview-13K \
+    --dataset ${DATASET} \
     --input_key inputs \
     --output_key outputs \
     --train_batch_size 16 \